@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+Given a list of authors identified by their BAI, this script computes the citation
+metrics of each author in one process and writes one CSV row per author.
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import index_names
+from parser import load_config, add_selection_arguments, add_refresh_arguments, check_selection_arguments, get_cache_size
+from profile import download_rate, download_burst
+
+
+fieldnames = ['BAI', 'hits', 'published', 'citeable', 'first_year', 'last_year',
+    'citations', 'citations_noself', 'citations_published', 'citations_published_noself']
+fieldnames += [f'{index}{suffix}' for index in index_names for suffix in ['', '_noself']]
+
+
+# Integer indices are written without decimals
+def format_value(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+# Load the profile of an author and compute one row of the table
+def author_row(BAI, collection='article', given_year=None, latest_years=None, number_of_authors=None, cache_size=0, store=None, refresh='never', max_age=0, rate=download_rate, burst=download_burst):
+    from pipeline import select_profile, get_report
+    from profile import DownloadError, load_profile
+    from results import ResultCache
+
+    # Messages of the download go to stderr, so that stdout has only the table
+    # A failed download leaves the row empty; the other authors are still computed
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            data = load_profile(BAI, refresh=refresh, max_age=max_age, store=store, rate=rate, burst=burst)
+    except DownloadError as e:
+        print(f'{BAI}: {e}', file=sys.stderr)
+        return {'BAI': BAI}
+    data = select_profile(data, collection, given_year, latest_years, number_of_authors)
+
+    row = {'BAI': BAI, 'hits': len(data)}
+    if not len(data):
+        return row
+
+    selection = {'collection': collection, 'given_year': given_year, 'latest_years': latest_years, 'number_of_authors': number_of_authors}
+    report = get_report(data, BAI, selection, ResultCache(max_size=cache_size) if cache_size else None)
+    citations = report['citations']
+    row.update({'published': report['total_hits_published'], 'citeable': report['total_hits_citeable'],
+        'first_year': report['first_year'], 'last_year': report['last_year'],
+        'citations': citations['total']['total'], 'citations_noself': citations['total']['noself'],
+        'citations_published': citations['published']['total'], 'citations_published_noself': citations['published']['noself']})
+    if report['indices']:
+        for index, (value, value_noself) in report['indices'].items():
+            row[index] = format_value(value)
+            row[f'{index}_noself'] = format_value(value_noself)
+    return row
+
+
+# Read the BAIs from a file, one per line; empty lines and comments are skipped
+def read_BAIs(filename):
+    with open(filename, 'r') as f:
+        return [line.split('#')[0].strip() for line in f if line.split('#')[0].strip()]
+
+
+# Update the old databases in one background process, one after the other, instead of one process per profile
+def refresh_stale(BAIs, max_age=0, store=None):
+    from profile import get_datestamp, is_fresh, refresh_in_background
+
+    stale = []
+    for BAI in dict.fromkeys(BAIs):
+        datestamp = get_datestamp(f'{BAI}.json')
+        if datestamp is not None and not is_fresh(datestamp, max_age):
+            stale.append(BAI)
+    queued = refresh_in_background(stale, store=store)
+    if queued:
+        print(f'{len(queued)} old databases are being updated in the background, one after the other.', file=sys.stderr)
+
+
+def main(argv=None):
+    config = load_config()
+    default_collection = config['DEFAULT'].get('collection', 'article')
+
+    parser = argparse.ArgumentParser(description='Compute the citation metrics of many authors identified by their BAI, one CSV row per author.')
+    parser.add_argument('BAIs', nargs='*', help='BAI identifiers')
+    parser.add_argument('-f', '--file', dest='BAI_file',
+                      help='file with one BAI identifier per line')
+    add_selection_arguments(parser, default_collection)
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                      help='number of processes; default: number of CPUs')
+    parser.add_argument('--no-cache', action='store_true', dest='no_cache',
+                      help='compute the metrics again instead of using the cached results')
+    add_refresh_arguments(parser, config, 'never', ['always', 'never', 'background'])
+    parser.add_argument('--store', dest='store', metavar='FILE', default=config['DEFAULT'].get('record_store'),
+                      help='keep the records in a store shared by the profiles, so that the records of co-authors are downloaded once; default: record_store in config.ini')
+    parser.add_argument('-o', '--output', dest='output',
+                      help='output file; default: stdout')
+    args = parser.parse_args(argv)
+
+    check_selection_arguments(parser, args)
+    BAIs = args.BAIs + (read_BAIs(args.BAI_file) if args.BAI_file else [])
+    if not BAIs:
+        parser.error('No BAI given; please specify them as arguments or using -f.')
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        # The profiles are loaded and analysed in parallel, the rows are written in the given order
+        n = len(BAIs)
+        jobs = min(args.jobs or os.cpu_count() or 1, n)
+        # The processes share the rate limit of the downloads, so that the batch as a whole stays within it
+        rate, burst = download_rate / jobs, download_burst / jobs
+        # With the background policy the old databases are used now, and updated afterwards by a single process
+        refresh = 'never' if args.refresh == 'background' else args.refresh
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            cache_size = 0 if args.no_cache else get_cache_size(config)
+            rows = executor.map(author_row, BAIs, [args.collection] * n, [args.given_year] * n, [args.latest_years] * n, [args.number_of_authors] * n,
+                [cache_size] * n, [args.store] * n, [refresh] * n, [args.max_age] * n, [rate] * n, [burst] * n)
+            for row in rows:
+                writer.writerow(row)
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if args.refresh == 'background':
+        refresh_stale(BAIs, args.max_age, args.store)
+
+
+if __name__ == '__main__':
+    main()
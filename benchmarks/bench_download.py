@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the profile download against a fixture served by a local fake server:
+bytes transferred and peak RSS of the full-record download, stripped at the end,
+and of the projected download, stripped page by page.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transport import INSPIRE_API, RequestsTransport
+
+
+# Transport pointing to the local fake server instead of inspirehep.net
+class LocalTransport(RequestsTransport):
+    def __init__(self, address, **kwargs):
+        super().__init__(**kwargs)
+        self.address = address
+
+    def get(self, url, params=None):
+        return super().get(url.replace(INSPIRE_API, self.address), params)
+
+
+# Download as it was done before the projection: full records, stripped only at the end
+def download_full_records(transport, BAI, workers):
+    from datetime import datetime
+    from profile import fetch_all, normalize_hit, open_query
+    from transport import RateLimiter
+
+    current_year = datetime.today().year
+    _, pages, fetch_page = open_query(f'a {BAI}', transport, RateLimiter(0))
+    data = fetch_all(fetch_page, pages, workers)
+    for hit in data:
+        normalize_hit(hit, current_year)
+    return data
+
+
+# Run one mode and print its measures as JSON
+def run_client(mode, address, workers):
+    from profile import download_profile
+
+    transport = LocalTransport(address, pool_size=workers)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        if mode == 'full':
+            data = download_full_records(transport, 'Bench.1', workers)
+        else:
+            data = download_profile('Bench.1', transport=transport, workers=workers, rate=0)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'mode': mode, 'hits': len(data), 'bytes': transport.bytes_received, 'peak_rss': peak_rss}))
+
+
+# Record a fixture from inspirehep.net
+def record_fixture(BAI, output, workers):
+    from profile import fetch_all, open_query
+    from transport import RateLimiter
+
+    _, pages, fetch_page = open_query(f'a {BAI}', RequestsTransport(pool_size=workers), RateLimiter(3, 5))
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(fetch_all(fetch_page, pages, workers), f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the profile download against a recorded fixture.')
+    parser.add_argument('fixture', help='JSON file with the list of raw records')
+    parser.add_argument('--record', metavar='BAI', help='record the fixture from inspirehep.net for the given BAI')
+    parser.add_argument('--client', choices=['full', 'projected'], help=argparse.SUPPRESS)
+    parser.add_argument('--address', help=argparse.SUPPRESS)
+    parser.add_argument('-w', '--workers', type=int, default=4, help='download threads')
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture(args.record, args.fixture, args.workers)
+        return
+    if args.client:
+        run_client(args.client, args.address, args.workers)
+        return
+
+    # Start the fake server and run each mode in a fresh process, so that peak RSS is not shared
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_server.py'), args.fixture, '-p', '0'],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        address = server.stdout.readline().split()[-1]
+        print(f'{"mode":<10} {"hits":>8} {"MB transferred":>15} {"peak RSS (MB)":>14}')
+        for mode in ['full', 'projected']:
+            output = subprocess.run([sys.executable, __file__, args.fixture, '--client', mode, '--address', address, '-w', str(args.workers)],
+                capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f'{mode:<10} {result["hits"]:>8} {result["bytes"] / 2**20:>15.1f} {result["peak_rss"] / 2**20:>14.1f}')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the kernels of metrics.compute_metrics on synthetic citation arrays of
+increasing size, and check that they give the same indices.
+"""
+
+import argparse
+import os
+import sys
+from timeit import Timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import compute_metrics, kernels
+
+
+# Citation arrays with a heavy tail, as in real profiles
+def make_citations(size, seed=0):
+    rng = np.random.default_rng(seed)
+    cits = (rng.pareto(1.1, size) * 3).astype(int)
+    return {'cits': cits,
+        'cits_noself': np.maximum(0, cits - rng.integers(0, 5, size)),
+        'authors': np.where(rng.random(size) < 0.95, rng.integers(1, 9, size), rng.integers(100, 3000, size)),
+        'age': rng.integers(1, 40, size)}
+
+
+# Best time of a few runs, in milliseconds
+def best_time(function, repeat=5):
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the kernels of compute_metrics.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6],
+                      help='number of papers of the arrays')
+    args = parser.parse_args()
+
+    print(f'{"papers":>9}' + ''.join(f'{kernel + " (ms)":>16}' for kernel in kernels) + f'{"speed-up":>10}')
+    for size in args.sizes:
+        cits = make_citations(size)
+        results = [compute_metrics(cits, 20, kernel=kernel) for kernel in kernels]
+        if any(result != results[0] for result in results):
+            raise SystemExit(f'The kernels give different indices for {size} papers.')
+        times = [best_time(lambda: compute_metrics(cits, 20, kernel=kernel)) for kernel in kernels]
+        print(f'{size:>9}' + ''.join(f'{time:>16.3f}' for time in times) + f'{times[0] / times[1]:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the whole pipeline on synthetic profiles of increasing size: wall time
+and peak memory of each stage, from parsing BAI.json to the report and the
+timeline. The results can be saved as JSON and compared between versions.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timings
+from synthetic import make_profile_hits, write_profile
+from timings import PhaseTimer
+
+BAI = 'Bench.1'
+
+
+# Run the stages of the pipeline once, timed by the given timer; the columnar cache is built from scratch
+def run_pipeline(collection, timer):
+    from pipeline import compute_report, compute_timeline_report, select_profile
+    from profile import load_columns
+
+    for suffix in ['.npy', '.strings.json']:
+        if os.path.exists(f'{BAI}{suffix}'):
+            os.remove(f'{BAI}{suffix}')
+
+    timings.enable(timer)
+    try:
+        with timer.phase('parse JSON and build columns') as record:
+            data = load_columns(BAI)
+            record['hits'] = len(data)
+        with timer.phase('load cached columns') as record:
+            data = load_columns(BAI)
+            record['hits'] = len(data)
+        with timer.phase('select') as record:
+            data = select_profile(data, collection)
+            record['hits'] = len(data)
+        with timer.phase('compute report'):
+            compute_report(data)
+        with timer.phase('compute timeline'):
+            compute_timeline_report(data)
+    finally:
+        timings.enable(None)
+    return timer.phases
+
+
+# Benchmark one size in the current process and print the result as JSON
+# The best time of the runs is kept for each stage; the peak memory comes from one more run with tracemalloc
+def run_size(hits, seed, repeat, collection):
+    import numpy
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        json_bytes = write_profile(f'{BAI}.json', make_profile_hits(hits, seed))
+        runs = [run_pipeline(collection, PhaseTimer()) for _ in range(repeat)]
+        phases = run_pipeline(collection, PhaseTimer(trace_memory=True))
+    for i, phase in enumerate(phases):
+        phase['seconds'] = min(run[i]['seconds'] for run in runs)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'hits': hits, 'json_bytes': json_bytes, 'peak_rss': peak_rss, 'numpy': numpy.__version__, 'phases': phases}))
+
+
+# Commit of the working tree, if it is a git repository
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print the stages of one size, with the ratio to the baseline if given
+def print_result(result, baseline=None):
+    print(f"\n{result['hits']} hits, BAI.json {result['json_bytes'] / 2**20:.1f} MB, peak RSS {result['peak_rss'] / 2**20:.1f} MB")
+    print(f'{"Stage":<32} {"ms":>10} {"peak MB":>9}' + (f' {"baseline ms":>12} {"ratio":>7}' if baseline else ''))
+    reference = {(phase['depth'], phase['name']): phase for phase in baseline['phases']} if baseline else {}
+    for phase in result['phases']:
+        name = '  ' * phase['depth'] + phase['name']
+        line = f"{name:<32} {phase['seconds'] * 1e3:>10.2f} {phase['peak_bytes'] / 2**20:>9.2f}"
+        old = reference.get((phase['depth'], phase['name']))
+        if old:
+            line += f" {old['seconds'] * 1e3:>12.2f} {phase['seconds'] / old['seconds']:>6.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic profiles.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10**2, 10**3, 10**4, 10**5],
+                      help='number of hits of the profiles, up to one million')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timed runs of each size')
+    parser.add_argument('-c', '--collection', default='article', help='collection selected; default: article')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the profiles')
+    parser.add_argument('-o', '--output', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare with the results saved in FILE')
+    parser.add_argument('--client', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client is not None:
+        run_size(args.client, args.seed, args.repeat, args.collection)
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = {result['hits']: result for result in json.load(f)['results']}
+
+    # Each size runs in a fresh process, so that peak RSS is not shared
+    results = []
+    for hits in args.sizes:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--client', str(hits), '--seed', str(args.seed),
+            '--repeat', str(args.repeat), '--collection', args.collection], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print_result(result, baseline.get(hits))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(), 'python': sys.version.split()[0],
+                'collection': args.collection, 'seed': args.seed, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
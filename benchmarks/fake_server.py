@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Local fake of the INSPIRE-HEP literature API, serving the records of a fixture file.
+"""
+
+import argparse
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# Keep only the requested metadata fields, like the API does with fields=
+def project(hit, fields):
+    if not fields:
+        return hit
+    return {'id': hit['id'], 'created': hit['created'], 'updated': hit['updated'],
+        'metadata': {key: value for key, value in hit['metadata'].items() if key in fields}}
+
+
+def make_handler(hits):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            selected = hits
+            # Only the record id queries are filtered, any other query returns the whole fixture
+            control_numbers = {int(number) for number in re.findall(r'recid:(\d+)', params.get('q', ''))}
+            if control_numbers:
+                selected = [hit for hit in hits if hit['metadata']['control_number'] in control_numbers]
+            size = int(params.get('size', 10))
+            page = int(params.get('page', 1))
+            fields = params['fields'].split(',') if 'fields' in params else None
+            page_hits = [project(hit, fields) for hit in selected[(page - 1) * size:page * size]]
+            body = json.dumps({'hits': {'total': len(selected), 'hits': page_hits}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(fixture, port=0, ready=None):
+    with open(fixture, 'r') as f:
+        hits = json.load(f)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(hits))
+    if ready:
+        ready(server.server_address[1])
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a fixture as a fake INSPIRE-HEP literature API.')
+    parser.add_argument('fixture', help='JSON file with the list of raw records')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='port to listen on')
+    args = parser.parse_args()
+    serve(args.fixture, args.port, ready=lambda port: print(f'Serving on http://127.0.0.1:{port}/api/literature', flush=True))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Generate synthetic INSPIRE-HEP literature records, with the same schema of the
+records returned by the API, or whole profiles with the same schema of the
+BAI.json files saved by download_profile, to run the benchmarks offline.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import textwrap
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+document_types = [['article'], ['article'], ['article'], ['conference paper'], ['proceedings'], ['book chapter'], ['report'], ['note'], ['thesis'], ['book']]
+publication_types = [['review'], ['lectures'], ['introductory']]
+
+
+# Generate one raw record, as returned by the literature API
+# A projected record has only the metadata fields requested by download_profile, without authors and references
+def make_raw_hit(control_number, rng, first_year=1990, last_year=2025, max_authors=3000, max_references=300, year=None, projected=False):
+    year = year or rng.randint(first_year, last_year)
+    # Most papers have a few authors, a few are large collaborations
+    author_count = rng.choice([1, 2, 2, 3, 3, 4, 5, 8]) if rng.random() < 0.95 else rng.randint(100, max_authors)
+    citation_count = int(rng.paretovariate(1.1)) - 1
+    metadata = {
+        '$schema': 'https://inspirehep.net/schemas/records/hep.json',
+        'control_number': control_number,
+        'titles': [{'title': f'Synthetic paper number {control_number}', 'source': 'arXiv'}],
+        'citation_count': citation_count,
+        'citation_count_without_self_citations': max(0, citation_count - rng.randint(0, 5)),
+        'author_count': author_count,
+        'earliest_date': f'{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'document_type': list(rng.choice(document_types)),
+    }
+    if not projected:
+        metadata.update({
+            'abstracts': [{'value': 'Lorem ipsum dolor sit amet. ' * rng.randint(5, 20), 'source': 'arXiv'}],
+            'authors': [{'full_name': f'Author, {i}', 'record': {'$ref': f'https://inspirehep.net/api/authors/{rng.randint(1, 10**6)}'},
+                'affiliations': [{'value': 'Synthetic U.'}]} for i in range(author_count)],
+            'references': [{'record': {'$ref': f'https://inspirehep.net/api/literature/{rng.randint(1, 2 * 10**6)}'}}
+                for _ in range(rng.randint(0, max_references))],
+            'keywords': [{'value': 'synthetic'}],
+            'inspire_categories': [{'term': 'Theory-HEP'}],
+        })
+    if rng.random() < 0.1:
+        metadata['publication_type'] = list(rng.choice(publication_types))
+    if metadata['document_type'] != ['thesis'] and rng.random() < 0.9:
+        metadata['citeable'] = True
+    if metadata['document_type'] == ['article'] and rng.random() < 0.7:
+        metadata['refereed'] = True
+        metadata['publication_info'] = [{'year': min(last_year, year + rng.randint(0, 1)), 'journal_title': 'Synth. J.'}]
+    return {
+        'id': str(control_number),
+        'created': f'{year}-01-01T00:00:00+00:00',
+        'updated': f'{last_year}-01-01T00:00:00+00:00',
+        'links': {link: f'https://inspirehep.net/api/literature/{control_number}?format={link}' for link in ['bibtex', 'latex-eu', 'latex-us', 'json', 'cv', 'citations']},
+        'metadata': metadata,
+    }
+
+
+# Generate a list of raw records, from the most recent
+def make_raw_hits(number_of_hits, seed=0, **kwargs):
+    rng = random.Random(seed)
+    hits = [make_raw_hit(10**6 + i, rng, **kwargs) for i in range(number_of_hits)]
+    hits.sort(key=lambda hit: hit['metadata']['earliest_date'], reverse=True)
+    return hits
+
+
+# Generate the hits of a profile as saved by download_profile, from the most recent, one at a time
+def make_profile_hits(number_of_hits, seed=0, first_year=1990, last_year=2025, **kwargs):
+    from profile import normalize_hit
+
+    rng = random.Random(seed)
+    current_year = datetime.today().year
+    years = sorted((rng.randint(first_year, last_year) for _ in range(number_of_hits)), reverse=True)
+    for i, year in enumerate(years):
+        hit = make_raw_hit(10**6 + i, rng, first_year, last_year, year=year, projected=True, **kwargs)
+        yield normalize_hit(hit, current_year)
+
+
+# Write a profile in the format of save_profile, without holding all the hits in memory; return the number of bytes
+def write_profile(filename, hits):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, hit in enumerate(hits):
+            f.write((',\n' if i else '\n') + textwrap.indent(json.dumps(hit, ensure_ascii=False, indent=2), '  '))
+        f.write('\n]' if f.tell() > 1 else ']')
+        return f.tell()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic INSPIRE-HEP records, or a synthetic profile.')
+    parser.add_argument('-n', '--hits', type=int, default=1000, help='number of records')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='random seed')
+    parser.add_argument('-p', '--profile', action='store_true', help='write a profile as saved by download_profile, e.g. to BAI.json')
+    parser.add_argument('-o', '--output', required=True, help='output file')
+    args = parser.parse_args()
+
+    if args.profile:
+        write_profile(args.output, make_profile_hits(args.hits, args.seed))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(make_raw_hits(args.hits, args.seed), f)
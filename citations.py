@@ -12,111 +12,14 @@ __license__ = 'GPL'
 __email__ = 'edgardo<dot>franzin<at>gmail<dot>com'
 
 
-# Parser options
-from parser import args
-
-BAI = args.BAI
-given_year = args.given_year
-latest_years = args.latest_years
-collection = args.collection
-order = args.order
-number_of_authors = args.number_of_authors
-
-# Import datetime to set the current year
+# Heavy modules, NumPy and the pipeline, are imported only when needed:
+# a report already computed for the same snapshot and options is printed without them
+import os
+import sys
+from contextlib import contextmanager, redirect_stdout
 from datetime import datetime
-current_year = datetime.today().year
-
-# Import functions
-from profile import load_profile
-from selection import select_collection, select_interval, select_lessauthors, warnings, get_years_range
-
-# Load and select data
-data = load_profile(BAI)
-
-if number_of_authors:
-    data = select_lessauthors(data, number_of_authors)
-
-data = select_collection(data, collection)
-
-if latest_years:
-    range_years = range(current_year-latest_years+1, current_year+1)
-    data = select_interval(data, range_years)
-
-if given_year:
-    range_years = range(given_year, given_year+1)
-    data = select_interval(data, range_years)
-
-# Warning if data is empty
-warning = warnings(data, number_of_authors, latest_years, given_year, collection)
-if warning:
-    print(warning)
-    exit()
-
-# Year of the first and last hits
-first_year, last_year, active_years = get_years_range(data)
-
-# Sorting: default is from most recent
-if order:
-    data = data[::-1]
-
-# Dataclass and arrays to compute the citation metrics for published papers
-from dataclasses import dataclass, field
-import numpy as np
-
-@dataclass
-class Citations:
-    cits: list = field(default_factory=list)
-    cits_noself: list = field(default_factory=list)
-    authors: list = field(default_factory=list)
-    age: list = field(default_factory=list)
-
-    def add_citations(self, cits_count, cits_noself_count, author_count, age_of_publication):
-        self.cits.append(cits_count)
-        self.cits_noself.append(cits_noself_count)
-        self.authors.append(author_count)
-        self.age.append(age_of_publication)
-
-    # Convert internal lists to NumPy arrays
-    def to_numpy(self, dtype=int):
-        return {
-            'cits': np.asarray(self.cits, dtype=dtype),
-            'cits_noself': np.asarray(self.cits_noself, dtype=dtype),
-            'authors': np.asarray(self.authors, dtype=dtype),
-            'age': np.asarray(self.age, dtype=dtype),
-        }
-
-cits_total = Citations()
-cits_citeable = Citations()
-cits_published = Citations()
-
-for hit in data:
-    metadata = hit['metadata']
-    cits_count = metadata['citation_count']
-    cits_noself_count = metadata['citation_count_without_self_citations']
-    author_count = metadata['author_count']
-    age_of_publication = metadata['age_of_publication']
-
-    cits_total.add_citations(cits_count, cits_noself_count, author_count, age_of_publication)
-
-    if 'citeable' in metadata:
-        cits_citeable.add_citations(cits_count, cits_noself_count, author_count, age_of_publication)
-
-    if 'refereed' in metadata:
-        cits_published.add_citations(cits_count, cits_noself_count, author_count, age_of_publication)
-
-# Convert lists to NumPy arrays
-cits_total = cits_total.to_numpy()
-cits_citeable = cits_citeable.to_numpy()
-cits_published = cits_published.to_numpy()
-
-total_hits = cits_total['cits'].size
-total_hits_citeable = cits_citeable['cits'].size
-total_hits_published = cits_published['cits'].size
-
-# Count the number of citations and citations excluding self cites
-citations = {'total': {'total': np.sum(cits_total['cits']), 'noself': np.sum(cits_total['cits_noself'])},
-    'published': {'total': np.sum(cits_published['cits']), 'noself': np.sum(cits_published['cits_noself'])},
-    'citeable': {'total': np.sum(cits_citeable['cits']), 'noself': np.sum(cits_citeable['cits_noself'])}}
+
+from timings import PhaseTimer
 
 def bold(text):
     return f"\033[1m{text}\033[0m"
@@ -124,51 +27,319 @@ def bold(text):
 def italic(text):
     return f"\033[3m{text}\033[0m"
 
-# For each record print the title, the number of citations and the number of citations excluding self cites
-for i, hit in enumerate(data):
-    title = hit['metadata']['titles'][0]['title']
-    if 'refereed' in hit['metadata']:
-        title += '*'
-    print(f"{bold(title)}\
-          \nNumber of citations: {cits_total['cits'][i]}; Excluding self cites: {cits_total['cits_noself'][i]}")
-
-from summary import count_document_type, print_totals, breakdown_citations
-
-# Number of research works
-collection_title = collection if collection != 'all' else 'research works'
-print(f'\nNumber of {italic(collection_title)}: {total_hits}, published*: {total_hits_published}, citeable: {total_hits_citeable}')
-if number_of_authors:
-    print(f'Max number of authors: {number_of_authors}')
-if collection == 'all':
-    # Print the breakdown of document types by number; the sum of values can be larger that total_hits
-    doc_type_counts = count_document_type(data)
-    for key, value in sorted(doc_type_counts.items()):
-        print(f'   {key}: {value}')
-
-# Print the total number of citations with and without self cites
-if total_hits > 1:
-    print_totals(citations['total'])
-if total_hits > 1 and total_hits != total_hits_citeable:
-    print_totals(citations['citeable'], '(Citeable only)')
-if total_hits_published > 1:
-    print_totals(citations['published'], '(Published only)')
-
-# Compute some citation metrics https://en.wikipedia.org/wiki/Author-level_metrics
-# In this case they are computed for the published data
-from metrics import compute_metrics
-indices = compute_metrics(cits_published, active_years)
-format_index = lambda idx: f'{idx:g}' if idx.is_integer() else f'{idx:.2f}'
-
-if total_hits_published > 1:
-    bibliometrics_last_years = f' (last {latest_years} years)' if latest_years else ''
-    if given_year:
-        print(f'\n--Bibliometrics{bibliometrics_last_years}--\nNumber of publications: {total_hits_published}, citeable: {total_hits_citeable}, year: {given_year}')
+format_index = lambda idx: f'{idx:g}' if float(idx).is_integer() else f'{idx:.2f}'
+
+
+# Print the report, as formatted text
+def print_report(data, report, collection='article', given_year=None, latest_years=None, number_of_authors=None):
+    from summary import count_document_type, print_totals, format_breakdown
+
+    citations = report['citations']
+    indices = report['indices']
+    total_hits = report['total_hits']
+    total_hits_citeable = report['total_hits_citeable']
+    total_hits_published = report['total_hits_published']
+
+    # For each record print the title, the number of citations and the number of citations excluding self cites
+    refereed = data.refereed
+    cits = data.citation_count
+    cits_noself = data.citation_count_without_self_citations
+    for i, title in enumerate(data.titles):
+        if refereed[i]:
+            title += '*'
+        print(f"{bold(title)}\
+          \nNumber of citations: {cits[i]}; Excluding self cites: {cits_noself[i]}")
+
+    # Number of research works
+    collection_title = collection if collection != 'all' else 'research works'
+    print(f'\nNumber of {italic(collection_title)}: {total_hits}, published*: {total_hits_published}, citeable: {total_hits_citeable}')
+    if number_of_authors:
+        print(f'Max number of authors: {number_of_authors}')
+    if collection == 'all':
+        # Print the breakdown of document types by number; the sum of values can be larger that total_hits
+        doc_type_counts = count_document_type(data)
+        for key, value in sorted(doc_type_counts.items()):
+            print(f'   {key}: {value}')
+
+    # Print the total number of citations with and without self cites
+    if total_hits > 1:
+        print_totals(citations['total'])
+    if total_hits > 1 and total_hits != total_hits_citeable:
+        print_totals(citations['citeable'], '(Citeable only)')
+    if total_hits_published > 1:
+        print_totals(citations['published'], '(Published only)')
+
+    if total_hits_published > 1:
+        bibliometrics_last_years = f' (last {latest_years} years)' if latest_years else ''
+        if given_year:
+            print(f'\n--Bibliometrics{bibliometrics_last_years}--\nNumber of publications: {total_hits_published}, citeable: {total_hits_citeable}, year: {given_year}')
+        else:
+            print(f"\n--Bibliometrics{bibliometrics_last_years}--\nNumber of publications: {total_hits_published}, citeable: {total_hits_citeable}, active years: {report['active_years']} ({report['first_year']}–{report['last_year']})")
+        mean_citations = report['mean_citations']
+        print(f"Mean number of citations per paper: {mean_citations[0]:0.1f}; Excluding self cites: {mean_citations[1]:0.1f}")
+        for index in indices:
+            print(f'{index}: {format_index(indices[index][0])}; Excluding self cites: {format_index(indices[index][1])}')
+
+    # Breakdown of papers by citations
+    breakdown = format_breakdown(report['breakdown'])
+    print(breakdown) if breakdown else None
+
+
+# Print the timeline as a table, each cell with and without self cites; Docs/yr counts only the research works of that year
+def print_timeline(timeline):
+    index_names = ['h-index', 'g-index', 'i10-index', 'm-index', 'h-frac', 'o-index', 'L-index']
+    print(bold('--Bibliometrics by year: research works of that year, published papers up to each year--'))
+    header = f'{"Year":<6}{"Docs/yr":>8}{"Pubs":>6}{"Citations":>14}' + ''.join(f'{index:>14}' for index in index_names)
+    print(header)
+    for entry in timeline:
+        line = f"{entry['year']:<6}{entry['documents_in_year']:>8}{entry['published']:>6}{entry['citations'][0]:>8}|{entry['citations'][1]:<5}"
+        for index in index_names:
+            if entry['indices']:
+                value, value_noself = (format_index(value) for value in entry['indices'][index])
+                line += f'{value:>8}|{value_noself:<5}'
+            else:
+                line += f'{"–":>8}|{"–":<5}'
+        print(line)
+
+
+# Print the co-authors, the references and the self-citations of the selection
+def print_network(summary):
+    print(bold('--Co-authors and references--'))
+    print(f"Papers: {summary['papers']}, with authors and references: {summary['papers_with_network']}")
+    authors = summary['authors_per_paper']
+    print(f"Authors per paper: mean {authors['mean']:.1f}, median {authors['median']:g}, max {authors['max']}")
+    collaborators = summary['collaborators']
+    print(f"Collaborators: {collaborators['distinct']}, with more than one joint paper: {collaborators['repeated']}")
+    print(f"Groups of collaborators linked without the author: {collaborators['groups']}, the largest with {collaborators['largest_group']} authors")
+    if summary['top_collaborators']:
+        print(italic('Most frequent collaborators:'))
+        for collaborator in summary['top_collaborators']:
+            print(f"   {collaborator['name']}: {collaborator['papers']}")
+    references = summary['references']
+    print(f"References: {references['total']}, to papers of the profile: {references['to_profile']}, from {references['citing_papers']} papers")
+    print(f"Self-citations received: {summary['self_citations']}")
+    if summary['most_cited_by_profile']:
+        print(italic('Papers most cited by the selection:'))
+        for paper in summary['most_cited_by_profile']:
+            print(f"   {paper['title'] or paper['control_number']}: {paper['count']}")
+
+
+# Print the percentile and the normalized citation score of each paper, then the indicators of the selection
+def print_normalized(data, papers, summary):
+    print(bold('--Citations normalized by year and document type--'))
+    format_value = lambda value, pattern: '–' if value != value else format(value, pattern)
+    for i, title in enumerate(data.titles):
+        print(f"{bold(title)}\
+          \nPercentile: {format_value(papers['percentile'][i], '.1f')}; Excluding self cites: {format_value(papers['percentile_noself'][i], '.1f')}\
+          \nNormalized citations: {format_value(papers['score'][i], '.2f')}; Excluding self cites: {format_value(papers['score_noself'][i], '.2f')}")
+    print(f"\nPapers: {summary['papers']}, with reference distributions: {summary['papers_with_reference']}")
+    for name, (value, value_noself) in summary['indicators'].items():
+        if value is None:
+            continue
+        if name == 'top 10%':
+            print(f'{name}: {value:.1%}; Excluding self cites: {value_noself:.1%}')
+        else:
+            print(f'{name}: {value:.2f}; Excluding self cites: {value_noself:.2f}')
+
+
+# Write the report as JSON, CSV or NDJSON records; the papers are written before the rest of the report is computed
+def write_report(data, args, selection, warning=None, cache=None):
+    from output import writers, paper_records, summary_dict
+    from pipeline import get_report
+
+    file = open(args.output_file, 'w', encoding='utf-8', newline='') if args.output_file else sys.stdout
+    try:
+        writer = writers[args.output](file)
+        writer.begin()
+        for record in paper_records(data):
+            writer.paper(record)
+        if warning:
+            print(warning, file=sys.stderr)
+        else:
+            writer.summary(summary_dict(get_report(data, args.BAI, selection, cache), {'BAI': args.BAI, **selection}))
+        writer.end()
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+# Copy of what is written to stdout, to cache the output
+class Tee:
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+# Key of the output of a run, from the state of the snapshot and the options
+def output_key(args, cache):
+    try:
+        stat = os.stat(f'{args.BAI}.json')
+    except OSError:
+        return None
+    from profile import is_fresh
+
+    # An old snapshot is updated first, or asks for updates, unless the refresh policy uses it as it is
+    today = datetime.today().date()
+    if not is_fresh(datetime.fromtimestamp(stat.st_mtime).date(), args.max_age) and args.refresh != 'never':
+        return None
+    options = {key: value for key, value in vars(args).items()
+        if key not in ('BAI', 'profile_startup', 'cache_size', 'no_cache', 'full_update', 'store', 'refresh', 'max_age')}
+    # The output of --normalized depends also on the reference distributions
+    if args.normalized:
+        reference = os.stat(args.normalized)
+        options['normalized'] = f'{args.normalized}-{reference.st_mtime_ns}-{reference.st_size}'
+    return cache.key(args.BAI, f'output-{stat.st_mtime_ns}-{stat.st_size}', date=str(today), **options)
+
+
+# The text report goes to the output file, if given, otherwise to stdout
+@contextmanager
+def text_output(args):
+    if args.output != 'text' or not args.output_file:
+        yield
+        return
+    with open(args.output_file, 'w', encoding='utf-8') as file, redirect_stdout(file):
+        yield
+
+
+# Load, select and print; the phases are timed
+def run(args, cache, timer):
+    with timer.phase('import numpy'):
+        import numpy
+    with timer.phase('import pipeline'):
+        from profile import DownloadError, load_profile
+        from selection import warnings
+        from pipeline import select_profile, compute_timeline_report, get_report
+
+    selection = {'collection': args.collection, 'given_year': args.given_year,
+        'latest_years': args.latest_years, 'number_of_authors': args.number_of_authors}
+
+    # Load and select data
+    with timer.phase('load profile') as record:
+        try:
+            data = load_profile(args.BAI, incremental=not args.full_update, refresh=args.refresh, max_age=args.max_age, store=args.store, network=args.network)
+        except DownloadError as e:
+            print(e)
+            sys.exit(1)
+        record['hits'] = len(data)
+    profile = data
+    with timer.phase('select') as record:
+        data = select_profile(data, args.collection, args.given_year, args.latest_years, args.number_of_authors, args.order)
+        record['hits'] = len(data)
+
+        # Warning if data is empty
+        warning = warnings(data, args.number_of_authors, args.latest_years, args.given_year, args.collection)
+
+    with timer.phase('report'), text_output(args):
+        if args.network and not warning:
+            from network import NetworkColumns, network_summary
+            summary = network_summary(NetworkColumns.load(args.BAI), data, profile)
+            if args.output == 'text':
+                print_network(summary)
+            else:
+                from output import write_network
+                write_network(summary, args.output, args.output_file)
+            return
+
+        if args.normalized and not warning:
+            from reference import ReferenceDistributions, normalized_indicators
+            try:
+                reference = ReferenceDistributions.load(args.normalized)
+            except ValueError as e:
+                print(f'{e} Please build the reference distributions again with reference.py.')
+                sys.exit(1)
+            papers, summary = normalized_indicators(data, reference)
+            if args.output == 'text':
+                print_normalized(data, papers, summary)
+            else:
+                from output import write_normalized
+                write_normalized(data, papers, summary, args.output, args.output_file)
+            return
+
+        if args.timeline and not warning:
+            timeline = compute_timeline_report(data)
+            if args.output == 'text':
+                print_timeline(timeline)
+            else:
+                from output import write_timeline
+                write_timeline(timeline, args.output, args.output_file)
+            return
+
+        if args.output != 'text':
+            write_report(data, args, selection, warning, cache)
+            return
+
+        if warning:
+            print(warning)
+            return
+
+        report = get_report(data, args.BAI, selection, cache)
+        print_report(data, report, args.collection, args.given_year, args.latest_years, args.number_of_authors)
+
+
+def main(argv=None):
+    import timings
+
+    # Instrumentation of the pipeline, from the environment or the options; memory is traced only for the pipeline
+    timings_destination = timings.destination_from_environment()
+    timer = PhaseTimer()
+
+    # Parser options
+    with timer.phase('parse arguments'):
+        from parser import parse_args
+        from results import ResultCache
+        args = parse_args(argv)
+    cache = ResultCache(max_size=args.cache_size) if args.cache_size else None
+
+    timings_destination = args.timings or timings_destination
+    if timings_destination:
+        startup_phases = timer.phases
+        timer = PhaseTimer(trace_memory=True)
+        timer.phases += startup_phases
+        timings.enable(timer)
+        # With the instrumentation the whole pipeline is run, no cached output
+        cache = None
+
+    # Fast path: the same options on the same snapshot print the cached output
+    key = None
+    if cache is not None and not args.output_file:
+        with timer.phase('cached output lookup'):
+            key = output_key(args, cache)
+            output = cache.get(key) if key else None
+        if output is not None:
+            sys.stdout.write(output)
+            if args.profile_startup:
+                print_startup_profile(timer)
+            return
+
+    if key:
+        tee = Tee(sys.stdout)
+        with redirect_stdout(tee):
+            run(args, cache, timer)
+        cache.put(key, tee.getvalue())
     else:
-        print(f'\n--Bibliometrics{bibliometrics_last_years}--\nNumber of publications: {total_hits_published}, citeable: {total_hits_citeable}, active years: {active_years} ({first_year}–{last_year})')
-    print(f"Mean number of citations per paper: {np.mean(cits_published['cits']):0.1f}; Excluding self cites: {np.mean(cits_published['cits_noself']):0.1f}")
-    for index in indices:
-        print(f'{index}: {format_index(indices[index][0])}; Excluding self cites: {format_index(indices[index][1])}')
-
-# Breakdown of papers by citations
-breakdown = breakdown_citations(cits_citeable['cits'], cits_citeable['cits_noself'], cits_published['cits'], cits_published['cits_noself'])
-print(breakdown) if breakdown else None
+        run(args, cache, timer)
+
+    if args.profile_startup:
+        print_startup_profile(timer)
+    if timings_destination:
+        timer.write(timings_destination)
+
+
+# Print the timings of the phases to stderr
+def print_startup_profile(timer):
+    print(f"\n--Startup profile (NumPy imported: {'yes' if 'numpy' in sys.modules else 'no'})--", file=sys.stderr)
+    timer.report(sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
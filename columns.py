@@ -0,0 +1,157 @@
+# Compact columnar representation of a profile, cached next to the JSON file
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+# One row per hit; the flags are a bitset: refereed, citeable, then one bit per document type
+record_dtype = np.dtype([
+    ('control_number', 'i8'),
+    ('citation_count', 'i4'),
+    ('citation_count_without_self_citations', 'i4'),
+    ('author_count', 'i4'),
+    ('year', 'i2'),
+    ('age', 'i2'),
+    ('flags', 'u8'),
+])
+REFEREED = np.uint64(1)
+CITEABLE = np.uint64(2)
+FIRST_DOCUMENT_TYPE_BIT = 2
+
+# Bump when the layout changes, so that older caches are rebuilt
+CACHE_VERSION = 2
+
+
+@dataclass
+class ProfileColumns:
+    records: np.ndarray
+    titles: list
+    document_types: list
+    # Content hash of the JSON file the columns were built from
+    snapshot: str = None
+
+    # The hits can be any iterable, e.g. streamed from the JSON file: the records grow in chunks and the hits are not kept
+    @classmethod
+    def from_hits(cls, data, chunk_size=4096):
+        records = np.empty(chunk_size, dtype=record_dtype)
+        titles = []
+        # Bits of the document types in order of appearance
+        bits = {}
+        size = 0
+        for hit in data:
+            if size == records.size:
+                records = np.concatenate([records, np.empty(records.size, dtype=record_dtype)])
+            metadata = hit['metadata']
+            flags = 0
+            if 'refereed' in metadata:
+                flags |= int(REFEREED)
+            if 'citeable' in metadata:
+                flags |= int(CITEABLE)
+            for doc in metadata.get('document_type', []):
+                if doc not in bits:
+                    if len(bits) == 64 - FIRST_DOCUMENT_TYPE_BIT:
+                        raise ValueError('Too many document types for the flag bitset.')
+                    bits[doc] = 1 << (FIRST_DOCUMENT_TYPE_BIT + len(bits))
+                flags |= bits[doc]
+            records[size] = (metadata.get('control_number', -1), metadata['citation_count'], metadata['citation_count_without_self_citations'],
+                metadata['author_count'], metadata['publication_or_earliest_date'], metadata['age_of_publication'], flags)
+            titles.append(metadata['titles'][0]['title'])
+            size += 1
+        records = records[:size].copy()
+
+        # The bits of the document types follow their alphabetical order
+        document_types = sorted(bits)
+        if list(bits) != document_types:
+            flags = records['flags']
+            sorted_flags = flags & (REFEREED | CITEABLE)
+            for i, doc in enumerate(bits):
+                bit = np.uint64(FIRST_DOCUMENT_TYPE_BIT + i)
+                sorted_flags |= ((flags >> bit) & np.uint64(1)) << np.uint64(FIRST_DOCUMENT_TYPE_BIT + document_types.index(doc))
+            records['flags'] = sorted_flags
+        return cls(records, titles, document_types)
+
+    def __len__(self):
+        return self.records.size
+
+    # Select a subset of the hits, by boolean mask, index array or slice
+    def __getitem__(self, selection):
+        # Slices are views of the records
+        if isinstance(selection, slice):
+            return ProfileColumns(self.records[selection], self.titles[selection], self.document_types, self.snapshot)
+        indices = np.flatnonzero(selection) if np.asarray(selection).dtype == bool else selection
+        return ProfileColumns(self.records[indices], [self.titles[i] for i in indices], self.document_types, self.snapshot)
+
+    @property
+    def citation_count(self):
+        return self.records['citation_count']
+
+    @property
+    def citation_count_without_self_citations(self):
+        return self.records['citation_count_without_self_citations']
+
+    @property
+    def author_count(self):
+        return self.records['author_count']
+
+    @property
+    def year(self):
+        return self.records['year']
+
+    @property
+    def age(self):
+        return self.records['age']
+
+    @property
+    def refereed(self):
+        return (self.records['flags'] & REFEREED) != 0
+
+    @property
+    def citeable(self):
+        return (self.records['flags'] & CITEABLE) != 0
+
+    # Boolean mask of the hits of a given document type
+    def has_document_type(self, doc):
+        if doc not in self.document_types:
+            return np.zeros(len(self), dtype=bool)
+        bit = np.uint64(1 << (FIRST_DOCUMENT_TYPE_BIT + self.document_types.index(doc)))
+        return (self.records['flags'] & bit) != 0
+
+    # Save the columns as {prefix}.npy, which can be memory-mapped, and the strings as {prefix}.strings.json
+    def save(self, prefix):
+        strings = {'version': CACHE_VERSION, 'snapshot': self.snapshot, 'document_types': self.document_types, 'titles': self.titles}
+        # Write to temporary files first, so that a cache is never left half written
+        with open(f'{prefix}.strings.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(strings, f, ensure_ascii=False)
+        with open(f'{prefix}.npy.tmp', 'wb') as f:
+            np.save(f, self.records)
+        os.replace(f'{prefix}.strings.json.tmp', f'{prefix}.strings.json')
+        os.replace(f'{prefix}.npy.tmp', f'{prefix}.npy')
+
+    @classmethod
+    def load(cls, prefix, mmap_mode='r'):
+        with open(f'{prefix}.strings.json', 'r', encoding='utf-8') as f:
+            strings = json.load(f)
+        if strings.get('version') != CACHE_VERSION:
+            raise ValueError(f'Cache version {strings.get("version")} not supported.')
+        records = np.load(f'{prefix}.npy', mmap_mode=mmap_mode)
+        return cls(records, strings['titles'], strings['document_types'], strings['snapshot'])
+
+
+# Content hash of a file, read in chunks
+def file_hash(filename, chunk_size=2**20):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Check if the cache of a JSON file exists and is newer than it
+def is_cache_fresh(prefix, filename):
+    try:
+        json_mtime = os.path.getmtime(filename)
+        return min(os.path.getmtime(f'{prefix}.npy'), os.path.getmtime(f'{prefix}.strings.json')) >= json_mtime
+    except OSError:
+        return False
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+"""
+Given an author identified by the BAI, this script computes the totals, the citation
+metrics and the breakdown of papers by citations for every combination of collection,
+year bucket and maximum number of authors, and writes them as one table.
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from batch import format_value
+from metrics import index_names
+from parser import collections, load_config, add_refresh_arguments, output_formats
+
+# Categories of the breakdown, by their range of citations
+breakdown_names = ['0', '1-9', '10-49', '50-99', '100-249', '250-499', '500+']
+
+fieldnames = ['collection', 'years', 'max_authors', 'hits', 'citeable', 'published', 'first_year', 'last_year',
+    'citations', 'citations_noself', 'citations_citeable', 'citations_citeable_noself', 'citations_published', 'citations_published_noself']
+fieldnames += [f'{index}{suffix}' for index in index_names for suffix in ['', '_noself']]
+fieldnames += [f'{group}_{name}' for group in ['citeable', 'citeable-noself', 'published', 'published-noself'] for name in breakdown_names]
+
+
+# Start of each run of equal values of a sorted array
+def segment_starts(groups):
+    return np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if groups.size else np.zeros(0, dtype=np.int64)
+
+
+# h-index and g^2 of each group, or only the h-index; the values are sorted in decreasing order within each group
+def grouped_h_g2(groups, values, number_of_groups, g=True):
+    order = np.lexsort((-values, groups))
+    groups, values = groups[order], values[order]
+    starts = segment_starts(groups)
+    lengths = np.diff(np.r_[starts, groups.size])
+    # Rank of each value within its group, from 1
+    rank = np.arange(1, groups.size + 1) - np.repeat(starts, lengths)
+    h = np.zeros(number_of_groups, dtype=values.dtype)
+    h[groups[starts]] = np.maximum.reduceat(np.minimum(values, rank), starts)
+    if not g:
+        return h, None, None
+    cumulative = np.cumsum(values)
+    within = cumulative - np.repeat(cumulative[starts] - values[starts], lengths)
+    g2 = np.zeros(number_of_groups, dtype=values.dtype)
+    g2[groups[starts]] = np.maximum.reduceat(np.minimum(within, np.square(rank)), starts)
+    largest = np.zeros(number_of_groups, dtype=values.dtype)
+    largest[groups[starts]] = values[starts]
+    return h, g2, largest
+
+
+# The indices of compute_metrics for every group of published papers, as arrays over the groups
+def grouped_metrics(groups, cits, active_years, number_of_groups):
+    bincount = lambda weights=None: np.bincount(groups, weights=weights, minlength=number_of_groups)
+    indices = {}
+    for suffix, values in [('', cits['cits']), ('_noself', cits['cits_noself'])]:
+        h, g2, largest = grouped_h_g2(groups, values, number_of_groups)
+        h_frac = grouped_h_g2(groups, values / cits['authors'], number_of_groups, g=False)[0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            indices[f'h-index{suffix}'] = h
+            indices[f'h-frac{suffix}'] = h_frac
+            indices[f'i10-index{suffix}'] = bincount(values >= 10).astype(np.int64)
+            indices[f'm-index{suffix}'] = h / active_years
+            indices[f'g-index{suffix}'] = np.sqrt(g2).astype(np.int64)
+            indices[f'o-index{suffix}'] = np.sqrt(h * largest)
+            indices[f'L-index{suffix}'] = np.log(1 + bincount(values / (cits['authors'] * cits['age'])))
+    return indices
+
+
+# Totals, indices and breakdown of every collection × year bucket × maximum number of authors, in one pass
+# Each paper is listed once for every combination of collection and maximum number of authors it belongs to,
+# with the group of its year bucket and the group of all the years; the groups are then reduced together
+def compute_groups(data, collections, year_bucket=1, author_caps=(None,)):
+    from metrics import compute_metrics
+    from pipeline import Citations
+    from selection import select_collection, select_lessauthors
+    from summary import bin_edges
+
+    years = data.year.astype(np.int64)
+    bucket_starts = years // year_bucket * year_bucket
+    buckets, bucket_index = np.unique(bucket_starts, return_inverse=True)
+    # The last bucket of each combination is the one of all the years
+    buckets_per_combination = buckets.size + 1
+
+    combinations = [(collection, cap) for collection in collections for cap in author_caps]
+    papers, groups = [], []
+    for k, (collection, cap) in enumerate(combinations):
+        mask = select_collection(data, collection)
+        if cap is not None:
+            mask = mask & select_lessauthors(data, cap)
+        selected = np.flatnonzero(mask)
+        papers += [selected, selected]
+        groups += [k * buckets_per_combination + bucket_index[selected], np.full(selected.size, (k + 1) * buckets_per_combination - 1)]
+    papers = np.concatenate(papers) if papers else np.zeros(0, dtype=np.int64)
+    groups = np.concatenate(groups) if groups else np.zeros(0, dtype=np.int64)
+    number_of_groups = len(combinations) * buckets_per_combination
+
+    cits = Citations.from_columns(data).to_numpy()
+    bincount = lambda groups, weights=None: np.bincount(groups, weights=weights, minlength=number_of_groups)
+    # Integer sums with bincount are exact up to 2^53
+    total = lambda groups, values: bincount(groups, values).astype(np.int64)
+
+    # Years of each group, of all the papers as in get_years_range
+    order = np.argsort(groups, kind='stable')
+    starts = segment_starts(groups[order])
+    first_year = np.zeros(number_of_groups, dtype=np.int64)
+    last_year = np.zeros(number_of_groups, dtype=np.int64)
+    first_year[groups[order][starts]] = np.minimum.reduceat(years[papers[order]], starts) if starts.size else []
+    last_year[groups[order][starts]] = np.maximum.reduceat(years[papers[order]], starts) if starts.size else []
+    active_years = last_year - first_year + 1
+
+    citeable = data.citeable[papers]
+    published = data.refereed[papers]
+    table = {'hits': bincount(groups), 'citeable': bincount(groups[citeable]), 'published': bincount(groups[published])}
+    for name, selected in [('', slice(None)), ('_citeable', citeable), ('_published', published)]:
+        table[f'citations{name}'] = total(groups[selected], cits['cits'][papers[selected]])
+        table[f'citations{name}_noself'] = total(groups[selected], cits['cits_noself'][papers[selected]])
+
+    # Indices of the published papers
+    published_cits = {key: values[papers[published]] for key, values in cits.items()}
+    indices = grouped_metrics(groups[published], published_cits, active_years, number_of_groups)
+    # Papers with no authors give non-finite values: these groups are computed as in compute_metrics
+    for group in np.unique(groups[published][published_cits['authors'] <= 0]).tolist():
+        in_group = groups[published] == group
+        metrics = compute_metrics({key: values[in_group] for key, values in published_cits.items()}, active_years[group])
+        for index, (value, value_noself) in metrics.items():
+            indices[index][group] = value
+            indices[f'{index}_noself'][group] = value_noself
+
+    # Breakdown of the citeable and published papers by citations
+    histograms = {}
+    for name, selected in [('citeable', citeable), ('published', published)]:
+        for suffix, values in [('', cits['cits']), ('-noself', cits['cits_noself'])]:
+            bins = np.digitize(values[papers[selected]], bin_edges)
+            histograms[f'{name}{suffix}'] = np.bincount(groups[selected] * len(breakdown_names) + bins,
+                minlength=number_of_groups * len(breakdown_names)).reshape(-1, len(breakdown_names))
+
+    rows = []
+    for group in np.flatnonzero(table['hits']).tolist():
+        collection, cap = combinations[group // buckets_per_combination]
+        bucket = group % buckets_per_combination
+        if bucket == buckets.size:
+            years_label = 'all'
+        elif year_bucket == 1:
+            years_label = str(buckets[bucket])
+        else:
+            years_label = f'{buckets[bucket]}-{buckets[bucket] + year_bucket - 1}'
+        row = {'collection': collection, 'years': years_label, 'max_authors': cap if cap is not None else '',
+            'first_year': int(first_year[group]), 'last_year': int(last_year[group])}
+        row.update({key: int(values[group]) for key, values in table.items()})
+        # As in compute_report: indices of the published papers, breakdown if there is more than one citeable paper
+        if row['published']:
+            row.update({index: format_value(values[group]) for index, values in indices.items()})
+        if row['citeable'] > 1:
+            for name, histogram in histograms.items():
+                if name.startswith('published') and not row['published']:
+                    continue
+                row.update({f'{name}_{category}': int(count) for category, count in zip(breakdown_names, histogram[group])})
+        rows.append({key: row[key] for key in fieldnames if key in row})
+    return rows
+
+
+# Write the table as CSV, JSON or NDJSON
+def write_rows(rows, output_format, file):
+    if output_format == 'json':
+        json.dump(rows, file, ensure_ascii=False)
+        file.write('\n')
+    elif output_format == 'ndjson':
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False) + '\n')
+    else:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    from profile import DownloadError, load_profile
+
+    config = load_config()
+    default_BAI = config['DEFAULT'].get('BAI', 'default')
+
+    parser = argparse.ArgumentParser(description='Compute the citation metrics of an author identified by the BAI for every collection, year bucket and maximum number of authors, as one table.')
+    parser.add_argument('-b', '--BAI', dest='BAI', default=default_BAI,
+                      help='BAI identifier')
+    parser.add_argument('-c', '--collections', dest='collections', nargs='+',
+                      help='collections; default: all and every document type of the profile')
+    parser.add_argument('--year-bucket', dest='year_bucket', type=int, default=1,
+                      help='number of years of each bucket, e.g. 5 for 2015-2019; default: 1')
+    parser.add_argument('-a', '--authors', dest='author_caps', type=int, nargs='+', default=[],
+                      help='maximum numbers of authors, e.g. 1 10 100; the table always has the rows with no maximum')
+    add_refresh_arguments(parser, config, 'ask')
+    parser.add_argument('--store', dest='store', metavar='FILE', default=config['DEFAULT'].get('record_store'),
+                      help='keep the records in a store shared by the profiles; default: record_store in config.ini')
+    parser.add_argument('--output', dest='output', choices=[output for output in output_formats if output != 'text'], default='csv',
+                      help='output format: csv, json, ndjson; default: csv')
+    parser.add_argument('-o', '--output-file', dest='output_file',
+                      help='write the table to a file instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.BAI == 'default':
+        parser.error('No default BAI found in config.ini; please specify one using -b.')
+    if args.collections and any(collection not in collections for collection in args.collections):
+        parser.error(f"Collection not valid. Please select among: {', '.join(collections)}.")
+    if args.year_bucket < 1:
+        parser.error('The year bucket must be at least one year.')
+
+    try:
+        data = load_profile(args.BAI, refresh=args.refresh, max_age=args.max_age, store=args.store)
+    except DownloadError as e:
+        print(e)
+        sys.exit(1)
+
+    rows = compute_groups(data, args.collections or ['all'] + data.document_types, args.year_bucket, [None] + sorted(set(args.author_caps)))
+
+    file = open(args.output_file, 'w', encoding='utf-8', newline='') if args.output_file else sys.stdout
+    try:
+        write_rows(rows, args.output, file)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Incremental parsing of a JSON file holding a top-level array, one element at a time
+import json
+
+whitespace = ' \t\n\r'
+
+
+# Yield the elements of the top-level array of a text file, reading it in chunks
+# Only the current chunk and the element being decoded are kept in memory
+def iter_array(file, chunk_size=2**16):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    expect_comma = False
+
+    # Read more of the file; the consumed part of the buffer is dropped
+    def refill(size=chunk_size):
+        nonlocal buffer, position
+        chunk = file.read(size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        return bool(chunk)
+
+    # Skip the whitespace, reading more if needed; return the next character, or '' at the end of the file
+    def peek():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in whitespace:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not refill():
+                return ''
+
+    if peek() != '[':
+        raise ValueError('Expected a JSON array.')
+    position += 1
+
+    while True:
+        character = peek()
+        if character == ']':
+            return
+        if expect_comma:
+            if character != ',':
+                raise ValueError(f'Expected , or ] in the JSON array, found {character!r}.')
+            position += 1
+            peek()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                # A number is complete only if followed by a delimiter, otherwise it may continue in the next chunk
+                if not isinstance(element, (int, float)) or isinstance(element, bool) or (end < len(buffer) and buffer[end] in whitespace + ',]'):
+                    break
+                if not refill(max(chunk_size, len(buffer))):
+                    break
+            except json.JSONDecodeError:
+                # The element continues in the next chunk; read at least as much as the buffer, to stay linear
+                if not refill(max(chunk_size, len(buffer))):
+                    raise
+        position = end
+        expect_comma = True
+        yield element
@@ -1,63 +1,161 @@
 import numpy as np
 
-def compute_metrics(cits, active_years):
-    # Return None if the array is empty
-    if cits['cits'].size == 0:
-        return None
+# Indices returned by compute_metrics
+index_names = ['h-index', 'h-frac', 'i10-index', 'm-index', 'g-index', 'o-index', 'L-index']
 
-    # Citations normalized by number of authors
-    cits_by_author = cits['cits']/cits['authors']
-    cits_noself_by_author = cits['cits_noself']/cits['authors']
-
-    # Number of hits
-    total_hits = cits['cits'].size
+# h-index, h-frac and g-index of the rows of a 2-D array, by sorting each row in decreasing order
+def sort_kernel(values, values_by_author):
+    total_hits = values.shape[1]
 
     # Save arrays [1,2,3,...] and [1,4,9,...]
     hits_array = np.arange(1, total_hits + 1)
     hits_array_squared = np.square(hits_array)
 
     # Sort the citation arrays in decreasing order
-    cits_sorted = np.sort(cits['cits'])[::-1]
-    cits_noself_sorted = np.sort(cits['cits_noself'])[::-1]
-    cits_by_author_sorted = np.sort(cits_by_author)[::-1]
-    cits_noself_by_author_sorted = np.sort(cits_noself_by_author)[::-1]
+    values_sorted = np.sort(values, axis=1)[:, ::-1]
+    values_by_author_sorted = np.sort(values_by_author, axis=1)[:, ::-1]
 
     # h-index: number of articles with at least h citations
-    h_index = np.max(np.minimum(cits_sorted, hits_array))
-    h_index_noself = np.max(np.minimum(cits_noself_sorted, hits_array))
+    h_index = np.max(np.minimum(values_sorted, hits_array), axis=1)
+    # h-frac: fractional h-index
+    h_frac = np.max(np.minimum(values_by_author_sorted, hits_array), axis=1)
+    # g-index: largest number of top g articles, which have received together at least g^2 citations
+    g2_index = np.max(np.minimum(np.cumsum(values_sorted, axis=1), hits_array_squared), axis=1)
+    return h_index, h_frac, g2_index
 
+
+# The top values of each row, in decreasing order, with a partial sort
+def top_sorted(values, top):
+    total_hits = values.shape[1]
+    if top < total_hits:
+        values = np.partition(values, total_hits - top, axis=1)[:, total_hits - top:]
+    return np.sort(values, axis=1)[:, ::-1]
+
+
+# h-index, h-frac and g-index of the rows of a 2-D array, with partial sorts; same results of sort_kernel
+# If h papers have at least h citations, their sum is at least h^2: the indices depend only on the sqrt(sum) largest values
+def partition_kernel(values, values_by_author):
+    total_hits = values.shape[1]
+    totals = np.sum(values, axis=1)
+
+    # The margin of 2 covers the rounding of the square root
+    top = min(total_hits, int(np.sqrt(np.max(totals))) + 2)
+    top_by_author = min(total_hits, int(np.sqrt(np.max(np.sum(values_by_author, axis=1)))) + 2)
+    hits_array = np.arange(1, top + 1)
+    values_sorted = top_sorted(values, top)
+    values_by_author_sorted = top_sorted(values_by_author, top_by_author)
+
+    # h-index: number of articles with at least h citations
+    h_index = np.max(np.minimum(values_sorted, hits_array), axis=1)
     # h-frac: fractional h-index
-    h_frac = np.max(np.minimum(cits_by_author_sorted, hits_array))
-    h_frac_noself = np.max(np.minimum(cits_noself_by_author_sorted, hits_array))
+    h_frac = np.max(np.minimum(values_by_author_sorted, np.arange(1, top_by_author + 1)), axis=1)
+    # g-index: beyond the top values the sum of the k largest values is less than k^2, so the maximum is the total sum
+    g2_index = np.max(np.minimum(np.cumsum(values_sorted, axis=1), np.square(hits_array)), axis=1)
+    if top < total_hits:
+        g2_index = np.maximum(g2_index, totals)
+    return h_index, h_frac, g2_index
+
+
+kernels = {'sort': sort_kernel, 'partition': partition_kernel}
+
+# The partial sorts pay off only on large profiles; below this number of papers a full sort is faster
+partition_min_hits = 10_000
+
+
+# The kernel is chosen by the number of papers, unless given
+def compute_metrics(cits, active_years, kernel=None):
+    # Return None if the array is empty
+    if cits['cits'].size == 0:
+        return None
+
+    # Citations and citations excluding self cites as the two rows of an array
+    values = np.stack([cits['cits'], cits['cits_noself']])
+    # Citations normalized by number of authors
+    values_by_author = values/cits['authors']
+
+    if kernel is None:
+        kernel = 'partition' if cits['cits'].size >= partition_min_hits else 'sort'
+    # Papers with no authors give non-finite values, only the sort kernel handles them
+    if not np.all(cits['authors'] > 0):
+        kernel = 'sort'
+    h_index, h_frac, g2_index = kernels[kernel](values, values_by_author)
 
     # i10-index: number of articles with at least 10 citations
-    i10_index = (cits['cits'] >= 10).sum()
-    i10_index_noself = (cits['cits_noself'] >= 10).sum()
+    i10_index = np.sum(values >= 10, axis=1)
 
     # m-index: h-index divided by the number of active years
     m_index = h_index / active_years
-    m_index_noself = h_index_noself / active_years
 
     # g-index: largest number of top g articles, which have received together at least g^2 citations
-    g2_index = np.max(np.minimum(np.cumsum(cits_sorted), hits_array_squared))
-    g_index = np.int64(np.sqrt(g2_index))
-    g2_index_noself = np.max(np.minimum(np.cumsum(cits_noself_sorted), hits_array_squared))
-    g_index_noself = np.int64(np.sqrt(g2_index_noself))
+    g_index = np.sqrt(g2_index).astype(np.int64)
 
     # o-index: geometric mean of the h-index and the most cited paper
-    o_index = np.sqrt(h_index * cits_sorted[0])
-    o_index_noself = np.sqrt(h_index_noself * cits_noself_sorted[0])
+    o_index = np.sqrt(h_index * np.max(values, axis=1))
 
     # L-index: combines citations, number of coauthors and age of publications
-    L_index = np.log(1 + np.sum(cits['cits']/(cits['authors'] * cits['age'])))
-    L_index_noself = np.log(1 + np.sum(cits['cits_noself']/(cits['authors'] * cits['age'])))
+    L_index = np.log(1 + np.sum(values/(cits['authors'] * cits['age']), axis=1))
 
     # Return the indices as a dictionary
-    return {'h-index': [h_index, h_index_noself],
-        'h-frac': [h_frac, h_frac_noself],
-        'i10-index': [i10_index, i10_index_noself],
-        'm-index': [m_index, m_index_noself],
-        'g-index': [g_index, g_index_noself],
-        'o-index': [o_index, o_index_noself],
-        'L-index': [L_index, L_index_noself]
-        }
+    return {index: [value[0], value[1]] for index, value in
+        zip(index_names, [h_index, h_frac, i10_index, m_index, g_index, o_index, L_index])}
+
+
+# Compute the indices of compute_metrics for the papers up to each year, from first_year to last_year,
+# with the current citation counts: the arrays are sorted once and the yearly subsets are masks over the sorted arrays
+def compute_timeline(cits, years, first_year, last_year):
+    timeline_years = np.arange(first_year, last_year + 1)
+    year_index = np.asarray(years) - first_year
+
+    # Sort once in decreasing order, keeping the year of each paper
+    def sort_by(values):
+        order = np.argsort(values, kind='stable')[::-1]
+        return values[order], year_index[order]
+
+    cits_by_author = cits['cits']/cits['authors']
+    cits_noself_by_author = cits['cits_noself']/cits['authors']
+    sorted_arrays = {name: sort_by(values) for name, values in
+        [('cits', cits['cits']), ('cits_noself', cits['cits_noself']), ('by_author', cits_by_author), ('noself_by_author', cits_noself_by_author)]}
+
+    # Yearly sums, accumulated over the years
+    def cumulative(weights):
+        return np.cumsum(np.bincount(year_index, weights=weights, minlength=timeline_years.size))
+
+    published = cumulative(None)
+    citations = cumulative(cits['cits'])
+    citations_noself = cumulative(cits['cits_noself'])
+    i10 = cumulative(cits['cits'] >= 10)
+    i10_noself = cumulative(cits['cits_noself'] >= 10)
+    L_sum = cumulative(cits['cits']/(cits['authors'] * cits['age']))
+    L_sum_noself = cumulative(cits['cits_noself']/(cits['authors'] * cits['age']))
+
+    # h-index, and g-index and largest value if needed, of the papers up to the given year
+    def h_g_max(name, year, g=False):
+        values, value_years = sorted_arrays[name]
+        included = value_years <= year
+        rank = np.cumsum(included)
+        h = np.max(np.where(included, np.minimum(values, rank), 0))
+        if not g:
+            return h, None, None
+        g2 = np.max(np.where(included, np.minimum(np.cumsum(np.where(included, values, 0)), np.square(rank)), 0))
+        return h, np.int64(np.sqrt(g2)), values[np.argmax(included)]
+
+    timeline = []
+    for i, year in enumerate(timeline_years):
+        entry = {'year': int(year), 'published': int(published[i]),
+            'citations': [int(citations[i]), int(citations_noself[i])], 'indices': None}
+        if published[i] > 0:
+            active_years = i + 1
+            h_index, g_index, max_cits = h_g_max('cits', i, g=True)
+            h_index_noself, g_index_noself, max_cits_noself = h_g_max('cits_noself', i, g=True)
+            h_frac = h_g_max('by_author', i)[0]
+            h_frac_noself = h_g_max('noself_by_author', i)[0]
+            entry['indices'] = {'h-index': [h_index, h_index_noself],
+                'h-frac': [h_frac, h_frac_noself],
+                'i10-index': [np.int64(i10[i]), np.int64(i10_noself[i])],
+                'm-index': [h_index / active_years, h_index_noself / active_years],
+                'g-index': [g_index, g_index_noself],
+                'o-index': [np.sqrt(h_index * max_cits), np.sqrt(h_index_noself * max_cits_noself)],
+                'L-index': [np.log(1 + L_sum[i]), np.log(1 + L_sum_noself[i])]
+                }
+        timeline.append(entry)
+    return timeline
@@ -0,0 +1,189 @@
+# Co-authors and references of the papers of a profile, kept as integer-encoded CSR arrays in {BAI}.network.npz
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+# Fields of the authors and of the references requested to the server in the network mode
+network_fields = ['authors.record', 'authors.full_name', 'references.record']
+
+# Bump when the layout changes, so that older files are rebuilt
+NETWORK_VERSION = 1
+
+
+# Record id from an API link, e.g. https://inspirehep.net/api/authors/1012345
+def record_id(link):
+    try:
+        return int(link['$ref'].rsplit('/', 1)[1])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+# Authors and references of a hit before it is stripped; authors with no record are identified by their name
+def extract_network(metadata):
+    authors = []
+    for author in metadata.get('authors', []):
+        recid = record_id(author.get('record', {}))
+        name = author.get('full_name', '')
+        authors.append([str(recid) if recid is not None else name, name])
+    references = [recid for recid in (record_id(reference.get('record', {})) for reference in metadata.get('references', [])) if recid is not None]
+    return {'authors': authors, 'references': references}
+
+
+# Values of the given rows of a CSR array, concatenated, and the length of each row
+def gather(indptr, values, rows):
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[offsets + np.arange(offsets.size)], lengths
+
+
+@dataclass
+class NetworkColumns:
+    # Rows sorted by control number
+    control_numbers: np.ndarray
+    # Authors of each row, as indices of the author table
+    author_indptr: np.ndarray
+    author_indices: np.ndarray
+    # Author table: record id, or name if there is no record, and name
+    author_keys: np.ndarray
+    author_names: np.ndarray
+    # Control numbers of the references of each row
+    reference_indptr: np.ndarray
+    references: np.ndarray
+
+    # Build the arrays from the networks of the hits, keyed by control number
+    @classmethod
+    def from_rows(cls, rows):
+        control_numbers = np.array(sorted(rows), dtype=np.int64)
+        author_table = {}
+        names = []
+        author_lengths = np.zeros(control_numbers.size, dtype=np.int64)
+        reference_lengths = np.zeros(control_numbers.size, dtype=np.int64)
+        author_indices = []
+        references = []
+        for i, control_number in enumerate(control_numbers.tolist()):
+            row = rows[control_number]
+            for key, name in row['authors']:
+                index = author_table.setdefault(key, len(author_table))
+                if index == len(names):
+                    names.append(name)
+                author_indices.append(index)
+            references += row['references']
+            author_lengths[i] = len(row['authors'])
+            reference_lengths[i] = len(row['references'])
+        return cls(control_numbers,
+            np.concatenate([[0], np.cumsum(author_lengths)]), np.array(author_indices, dtype=np.int32),
+            np.array(list(author_table), dtype=str), np.array(names, dtype=str),
+            np.concatenate([[0], np.cumsum(reference_lengths)]), np.array(references, dtype=np.int64))
+
+    # Networks of the given control numbers, as in from_rows; the missing ones are skipped
+    def rows(self, control_numbers):
+        positions = self.positions(control_numbers)
+        rows = {}
+        for control_number, position in zip(control_numbers, positions.tolist()):
+            if position < 0:
+                continue
+            authors = self.author_indices[self.author_indptr[position]:self.author_indptr[position+1]]
+            rows[control_number] = {
+                'authors': [[self.author_keys[i], self.author_names[i]] for i in authors.tolist()],
+                'references': self.references[self.reference_indptr[position]:self.reference_indptr[position+1]].tolist()}
+        return rows
+
+    # Rows of the given control numbers, -1 if missing
+    def positions(self, control_numbers):
+        control_numbers = np.asarray(control_numbers, dtype=np.int64)
+        if not self.control_numbers.size:
+            return np.full(control_numbers.size, -1)
+        positions = np.minimum(np.searchsorted(self.control_numbers, control_numbers), self.control_numbers.size - 1)
+        return np.where(self.control_numbers[positions] == control_numbers, positions, -1)
+
+    def save(self, prefix):
+        filename = f'{prefix}.network.npz'
+        with open(f'{filename}.tmp', 'wb') as f:
+            np.savez(f, version=NETWORK_VERSION, **vars(self))
+        os.replace(f'{filename}.tmp', filename)
+
+    @classmethod
+    def load(cls, prefix):
+        with np.load(f'{prefix}.network.npz', allow_pickle=False) as arrays:
+            if arrays['version'] != NETWORK_VERSION:
+                raise ValueError(f'Network version {arrays["version"]} not supported.')
+            return cls(**{name: arrays[name] for name in cls.__dataclass_fields__})
+
+
+# Save the networks of a profile; the records which were not downloaded again keep the ones in the current file
+def save_network(prefix, data, rows):
+    control_numbers = [hit['metadata']['control_number'] for hit in data]
+    missing = [control_number for control_number in control_numbers if control_number not in rows]
+    if missing:
+        try:
+            rows.update(NetworkColumns.load(prefix).rows(missing))
+        except (OSError, ValueError):
+            pass
+    NetworkColumns.from_rows({control_number: rows[control_number] for control_number in control_numbers if control_number in rows}).save(prefix)
+
+
+# Groups of collaborators linked by joint papers without the author of the profile; return the size of each group
+# The smallest label of the authors of each paper is propagated until nothing changes
+def collaborator_groups(indices, lengths, owner):
+    papers = np.repeat(np.arange(lengths.size), lengths)
+    keep = indices != owner
+    papers, indices = papers[keep], indices[keep]
+    if not indices.size:
+        return np.zeros(0, dtype=np.int64)
+    # Authors are numbered from 0, entries of each paper are contiguous
+    members, authors = np.unique(indices, return_inverse=True)
+    paper_starts = np.flatnonzero(np.r_[True, papers[1:] != papers[:-1]])
+    paper_lengths = np.diff(np.r_[paper_starts, papers.size])
+    order = np.argsort(authors, kind='stable')
+    author_starts = np.flatnonzero(np.r_[True, authors[order][1:] != authors[order][:-1]])
+
+    labels = np.arange(members.size)
+    while True:
+        paper_labels = np.repeat(np.minimum.reduceat(labels[authors], paper_starts), paper_lengths)
+        new_labels = np.minimum(labels, np.minimum.reduceat(paper_labels[order], author_starts))
+        # Jump to the label of the label, to shorten the chains
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return np.bincount(np.unique(labels, return_inverse=True)[1])
+
+
+# Co-authors, references and self-citations of the selected papers
+# The author of the profile is the author of most papers; profile gives the titles of the papers cited by the selection
+def network_summary(network, data, profile, top=10):
+    positions = network.positions(data.records['control_number'])
+    rows = positions[positions >= 0]
+    indices, lengths = gather(network.author_indptr, network.author_indices, rows)
+
+    counts = np.bincount(network.author_indices, minlength=network.author_keys.size)
+    owner = int(counts.argmax()) if counts.size else -1
+    collaborators = np.bincount(indices, minlength=network.author_keys.size)
+    if owner >= 0:
+        collaborators[owner] = 0
+    nonzero = np.flatnonzero(collaborators)
+    top_collaborators = nonzero[np.argsort(-collaborators[nonzero], kind='stable')[:top]]
+    groups = collaborator_groups(indices, lengths, owner)
+
+    # References to the papers of the profile
+    references, reference_lengths = gather(network.reference_indptr, network.references, rows)
+    internal = np.isin(references, network.control_numbers)
+    citing_papers = np.unique(np.repeat(np.arange(rows.size), reference_lengths)[internal]).size
+    cited, cited_counts = np.unique(references[internal], return_counts=True)
+    most_cited = np.argsort(-cited_counts, kind='stable')[:top]
+    titles = dict(zip(profile.records['control_number'].tolist(), profile.titles))
+
+    return {
+        'papers': len(data),
+        'papers_with_network': int(rows.size),
+        'authors_per_paper': {'mean': float(lengths.mean()) if lengths.size else 0.0, 'median': float(np.median(lengths)) if lengths.size else 0.0,
+            'max': int(lengths.max()) if lengths.size else 0},
+        'collaborators': {'distinct': int(nonzero.size), 'repeated': int(np.count_nonzero(collaborators >= 2)),
+            'groups': int(groups.size), 'largest_group': int(groups.max()) if groups.size else 0},
+        'top_collaborators': [{'id': str(network.author_keys[i]), 'name': str(network.author_names[i]), 'papers': int(collaborators[i])} for i in top_collaborators.tolist()],
+        'references': {'total': int(references.size), 'to_profile': int(np.count_nonzero(internal)), 'citing_papers': int(citing_papers)},
+        'self_citations': int(data.citation_count.sum(dtype=np.int64) - data.citation_count_without_self_citations.sum(dtype=np.int64)),
+        'most_cited_by_profile': [{'control_number': int(cited[i]), 'title': titles.get(int(cited[i]), ''), 'count': int(cited_counts[i])} for i in most_cited.tolist()],
+    }
@@ -0,0 +1,243 @@
+# Machine-readable output of the report: JSON, CSV or NDJSON records
+import csv
+import json
+
+import numpy as np
+
+# Columns of the CSV output; each record fills only some of them
+csv_fields = ['record', 'name', 'group', 'control_number', 'title', 'year', 'author_count', 'refereed', 'citeable',
+    'count', 'count_noself', 'citations', 'citations_noself', 'value', 'value_noself',
+    'BAI', 'collection', 'given_year', 'latest_years', 'number_of_authors', 'first_year', 'last_year', 'active_years']
+
+
+# Convert NumPy scalars for the JSON encoder
+def to_python(value):
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, np.floating):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+# Per-paper records, generated in chunks so that the output starts immediately
+def paper_records(data, chunk_size=1000):
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start+chunk_size]
+        records = chunk.records
+        columns = zip(records['control_number'].tolist(), chunk.titles, records['year'].tolist(), records['author_count'].tolist(),
+            chunk.refereed.tolist(), chunk.citeable.tolist(), records['citation_count'].tolist(), records['citation_count_without_self_citations'].tolist())
+        for control_number, title, year, author_count, refereed, citeable, citations, citations_noself in columns:
+            yield {'record': 'paper', 'control_number': control_number, 'title': title, 'year': year, 'author_count': author_count,
+                'refereed': refereed, 'citeable': citeable, 'citations': citations, 'citations_noself': citations_noself}
+
+
+# Summary of the report as a nested dictionary
+def summary_dict(report, selection):
+    citations = report['citations']
+    return {
+        'selection': selection,
+        'years': {'first': report['first_year'], 'last': report['last_year'], 'active': report['active_years']},
+        'totals': {
+            'total': {'count': report['total_hits'], 'citations': citations['total']['total'], 'citations_noself': citations['total']['noself']},
+            'citeable': {'count': report['total_hits_citeable'], 'citations': citations['citeable']['total'], 'citations_noself': citations['citeable']['noself']},
+            'published': {'count': report['total_hits_published'], 'citations': citations['published']['total'], 'citations_noself': citations['published']['noself']},
+        },
+        'indices': {index: {'value': values[0], 'value_noself': values[1]} for index, values in (report['indices'] or {}).items()},
+        'breakdown': report['breakdown'] or {},
+    }
+
+
+# Summary of the report as flat records
+def summary_records(summary):
+    yield {'record': 'selection', **summary['selection'], **{f'{key}_year' if key != 'active' else 'active_years': value for key, value in summary['years'].items()}}
+    for name, totals in summary['totals'].items():
+        yield {'record': 'totals', 'name': name, **totals}
+    for name, values in summary['indices'].items():
+        yield {'record': 'index', 'name': name, **values}
+    breakdown = summary['breakdown']
+    for group in ['citeable', 'published']:
+        if group in breakdown:
+            for category, count in breakdown[group].items():
+                yield {'record': 'breakdown', 'name': category, 'group': group, 'count': count, 'count_noself': breakdown[f'{group}-noself'][category]}
+
+
+# Writers: papers are written one at a time, then the summary
+class JSONWriter:
+    def __init__(self, file):
+        self.file = file
+        self.papers = 0
+        self.papers_closed = False
+
+    def begin(self):
+        self.file.write('{"papers": [')
+
+    def paper(self, record):
+        del record['record']
+        self.file.write((',\n  ' if self.papers else '\n  ') + json.dumps(record, ensure_ascii=False))
+        self.papers += 1
+
+    def close_papers(self):
+        if not self.papers_closed:
+            self.file.write('\n]' if self.papers else ']')
+            self.papers_closed = True
+
+    def summary(self, summary):
+        self.close_papers()
+        for key, value in summary.items():
+            self.file.write(f',\n"{key}": ' + json.dumps(value, ensure_ascii=False, default=to_python))
+
+    def end(self):
+        self.close_papers()
+        self.file.write('}\n')
+
+
+class NDJSONWriter:
+    def __init__(self, file):
+        self.file = file
+
+    def begin(self):
+        pass
+
+    def paper(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def summary(self, summary):
+        for record in summary_records(summary):
+            self.file.write(json.dumps(record, ensure_ascii=False, default=to_python) + '\n')
+
+    def end(self):
+        pass
+
+
+class CSVWriter:
+    def __init__(self, file):
+        self.writer = csv.DictWriter(file, fieldnames=csv_fields)
+
+    def begin(self):
+        self.writer.writeheader()
+
+    def paper(self, record):
+        self.writer.writerow(record)
+
+    def summary(self, summary):
+        for record in summary_records(summary):
+            self.writer.writerow({key: to_python(value) if isinstance(value, np.generic) else value for key, value in record.items()})
+
+    def end(self):
+        pass
+
+
+writers = {'json': JSONWriter, 'csv': CSVWriter, 'ndjson': NDJSONWriter}
+
+
+# Flat records of the timeline, one per year
+def timeline_records(timeline):
+    for entry in timeline:
+        record = {'record': 'timeline', 'year': entry['year'], 'documents_in_year': entry['documents_in_year'], 'published': entry['published'],
+            'citations': entry['citations'][0], 'citations_noself': entry['citations'][1]}
+        for index, values in (entry['indices'] or {}).items():
+            record[index] = values[0]
+            record[f'{index}_noself'] = values[1]
+        yield record
+
+
+# Write the timeline as JSON, CSV or NDJSON records
+def write_timeline(timeline, output_format, output_file=None):
+    import sys
+    from metrics import index_names
+
+    file = open(output_file, 'w', encoding='utf-8', newline='') if output_file else sys.stdout
+    try:
+        records = timeline_records(timeline)
+        if output_format == 'json':
+            json.dump({'timeline': [record for record in records]}, file, ensure_ascii=False, default=to_python)
+            file.write('\n')
+        elif output_format == 'ndjson':
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False, default=to_python) + '\n')
+        else:
+            fields = ['record', 'year', 'documents_in_year', 'published', 'citations', 'citations_noself']
+            fields += [f'{index}{suffix}' for index in index_names for suffix in ['', '_noself']]
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for record in records:
+                writer.writerow({key: to_python(value) if isinstance(value, np.generic) else value for key, value in record.items()})
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+# Flat records of the co-authors and references summary
+def network_records(summary):
+    collaborators = summary['collaborators']
+    references = summary['references']
+    authors = summary['authors_per_paper']
+    yield {'record': 'network', 'papers': summary['papers'], 'papers_with_network': summary['papers_with_network'],
+        'authors_mean': authors['mean'], 'authors_median': authors['median'], 'authors_max': authors['max'],
+        'collaborators': collaborators['distinct'], 'collaborators_repeated': collaborators['repeated'],
+        'groups': collaborators['groups'], 'largest_group': collaborators['largest_group'],
+        'references': references['total'], 'references_to_profile': references['to_profile'], 'citing_papers': references['citing_papers'],
+        'self_citations': summary['self_citations']}
+    for collaborator in summary['top_collaborators']:
+        yield {'record': 'collaborator', **collaborator}
+    for paper in summary['most_cited_by_profile']:
+        yield {'record': 'cited_by_profile', **paper}
+
+
+# Write the co-authors and references summary as JSON, CSV or NDJSON records
+def write_network(summary, output_format, output_file=None):
+    import sys
+
+    file = open(output_file, 'w', encoding='utf-8', newline='') if output_file else sys.stdout
+    try:
+        if output_format == 'json':
+            json.dump(summary, file, ensure_ascii=False)
+            file.write('\n')
+        elif output_format == 'ndjson':
+            for record in network_records(summary):
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            records = list(network_records(summary))
+            fields = list(dict.fromkeys(key for record in records for key in record))
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+# Per-paper records with the percentile and the normalized citation score; NaN, no reference, is written as null
+def normalized_records(data, papers):
+    columns = [papers[name].tolist() for name in ['percentile', 'percentile_noself', 'score', 'score_noself']]
+    for record, *values in zip(paper_records(data), *columns):
+        del record['record']
+        yield {**record, **{name: None if value != value else round(value, 4)
+            for name, value in zip(['percentile', 'percentile_noself', 'score', 'score_noself'], values)}}
+
+
+# Write the normalized citations as JSON, CSV or NDJSON records
+def write_normalized(data, papers, summary, output_format, output_file=None):
+    import sys
+
+    file = open(output_file, 'w', encoding='utf-8', newline='') if output_file else sys.stdout
+    try:
+        records = normalized_records(data, papers)
+        if output_format == 'json':
+            json.dump({'papers': list(records), 'papers_with_reference': summary['papers_with_reference'], 'indicators': summary['indicators']}, file, ensure_ascii=False)
+            file.write('\n')
+        else:
+            indicators = [{'record': 'indicator', 'name': name, 'value': values[0], 'value_noself': values[1]} for name, values in summary['indicators'].items()]
+            records = [{'record': 'paper', **record} for record in records] + indicators
+            if output_format == 'ndjson':
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                fields = ['record', 'name', 'control_number', 'title', 'year', 'author_count', 'refereed', 'citeable', 'citations', 'citations_noself',
+                    'percentile', 'percentile_noself', 'score', 'score_noself', 'value', 'value_noself']
+                writer = csv.DictWriter(file, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(records)
+    finally:
+        if file is not sys.stdout:
+            file.close()
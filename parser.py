@@ -1,42 +1,110 @@
 # Parse options
 import argparse
 import configparser
+import os
 
-# Load default values from config.ini
-config = configparser.ConfigParser()
-config.optionxform = str # config.ini case-sensitive
-config.read('config.ini')
-default_BAI = config['DEFAULT'].get('BAI', 'default')
-default_collection = config['DEFAULT'].get('collection', 'article')
-
-parser = argparse.ArgumentParser(description='Given an author identified by his/her BAI, this simple Python3 script counts the number of citations and the number of citations excluding self cites in the Inspirehep database (https://inspirehep.net/) for each paper in a given collection.')
-parser.add_argument('-b', '--BAI', dest='BAI',
-                  help='BAI identifier', default=default_BAI)
-# argument -y/--year is not allowed with argument -l/--latest, and vice versa
-year_range_group = parser.add_mutually_exclusive_group()
-year_range_group.add_argument('-y', '--year', dest='given_year', type=int,
-                  help='results for a given year, e.g. 2020')
-year_range_group.add_argument('-l', '--latest', dest='latest_years', type=int,
-                  help='results for the latest given years, e.g. 5')
-parser.add_argument('-c', '--collection', dest='collection',
-                  help='collections: all, article, book, bookchapter, conferencepaper, introductory, lectures, note, proceedings, published, report, review, thesis; default: article', default=default_collection)
-parser.add_argument('-a', '--authors', dest='number_of_authors', type=int,
-                  help='results with a given number of authors or less, e.g. 10')
-parser.add_argument('-r', '--reversed', action='store_true', dest='order',
-                  help='list the items in chronological order')
-
-args = parser.parse_args()
-
-if args.BAI == 'default':
-    parser.error("No default BAI found in config.ini; please specify one using -b.")
+from profile import refresh_policies
+
+output_formats = ['text', 'json', 'csv', 'ndjson']
 
 collections = ['all', 'article', 'book', 'bookchapter', 'conferencepaper', 'introductory', 'lectures', 'note', 'proceedings', 'published', 'report', 'review', 'thesis']
-if args.collection not in collections:
-    parser.error(f"Collection not valid. Please select one among: {', '.join(collections)}.")
-
-# Save BAI as default in config.ini if it was provided and is not already set
-if default_BAI == 'default' and args.BAI != 'default':
-    config['DEFAULT']['BAI'] = args.BAI
-    with open('config.ini', 'w') as configfile:
-        config.write(configfile)
-    print(f"{args.BAI} saved as default BAI in config.ini.")
+
+
+# Load default values from config.ini
+def load_config():
+    config = configparser.ConfigParser()
+    config.optionxform = str # config.ini case-sensitive
+    config.read('config.ini')
+    return config
+
+
+# Add the selection options, shared by the single-author and the batch scripts
+def add_selection_arguments(parser, default_collection):
+    # argument -y/--year is not allowed with argument -l/--latest, and vice versa
+    year_range_group = parser.add_mutually_exclusive_group()
+    year_range_group.add_argument('-y', '--year', dest='given_year', type=int,
+                      help='results for a given year, e.g. 2020')
+    year_range_group.add_argument('-l', '--latest', dest='latest_years', type=int,
+                      help='results for the latest given years, e.g. 5')
+    parser.add_argument('-c', '--collection', dest='collection',
+                      help='collections: all, article, book, bookchapter, conferencepaper, introductory, lectures, note, proceedings, published, report, review, thesis; default: article', default=default_collection)
+    parser.add_argument('-a', '--authors', dest='number_of_authors', type=int,
+                      help='results with a given number of authors or less, e.g. 10')
+
+
+# Add the options on the age of the local databases, shared by the single-author and the batch scripts
+# The defaults are the refresh and max_age values in config.ini; the batch script cannot ask
+def add_refresh_arguments(parser, config, default_refresh, policies=refresh_policies):
+    refresh = config['DEFAULT'].get('refresh', default_refresh)
+    parser.add_argument('--refresh', dest='refresh', choices=policies, default=refresh if refresh in policies else default_refresh,
+                      help=f"what to do with a database older than the maximum age: {', '.join(policies)}; background uses the old database and updates it for the next run; default: {default_refresh}")
+    parser.add_argument('--max-age', dest='max_age', type=int, metavar='DAYS', default=int(config['DEFAULT'].get('max_age', '0')),
+                      help='maximum age in days of a database used without updating it; default: 0, only a database from today')
+
+
+# Size of the cache of the results in bytes, from the cache_size option in MB
+def get_cache_size(config):
+    return int(float(config['DEFAULT'].get('cache_size', '64')) * 2**20)
+
+
+# Check the selection options
+def check_selection_arguments(parser, args):
+    if args.collection not in collections:
+        parser.error(f"Collection not valid. Please select one among: {', '.join(collections)}.")
+
+
+def parse_args(argv=None):
+    config = load_config()
+    default_BAI = config['DEFAULT'].get('BAI', 'default')
+    default_collection = config['DEFAULT'].get('collection', 'article')
+
+    parser = argparse.ArgumentParser(description='Given an author identified by his/her BAI, this simple Python3 script counts the number of citations and the number of citations excluding self cites in the Inspirehep database (https://inspirehep.net/) for each paper in a given collection.')
+    parser.add_argument('-b', '--BAI', dest='BAI',
+                      help='BAI identifier', default=default_BAI)
+    add_selection_arguments(parser, default_collection)
+    parser.add_argument('--full-update', action='store_true', dest='full_update',
+                      help='download the whole profile again instead of updating the local one')
+    add_refresh_arguments(parser, config, 'ask')
+    parser.add_argument('--store', dest='store', metavar='FILE', default=config['DEFAULT'].get('record_store'),
+                      help='keep the records in a store shared by the profiles, e.g. records.sqlite, so that the records of co-authors are downloaded once; default: record_store in config.ini')
+    parser.add_argument('-r', '--reversed', action='store_true', dest='order',
+                      help='list the items in chronological order')
+    parser.add_argument('--timeline', action='store_true', dest='timeline',
+                      help='indices of the published papers up to each year, from the first to the last year')
+    parser.add_argument('--network', action='store_true', dest='network',
+                      help='co-authors, references and self-citations of the selected papers; the first time, the authors and the references of the profile are downloaded')
+    parser.add_argument('--normalized', nargs='?', const=config['DEFAULT'].get('reference', 'reference.npz'), dest='normalized', metavar='FILE',
+                      help='percentile and normalized citation score of each paper within its year and document type, from the reference distributions built by reference.py; default: reference in config.ini, or reference.npz')
+    parser.add_argument('--no-cache', action='store_true', dest='no_cache',
+                      help='compute the metrics again instead of using the cached results')
+    parser.add_argument('--profile-startup', action='store_true', dest='profile_startup',
+                      help='print the timings of the imports and of the phases of the run to stderr')
+    parser.add_argument('--timings', nargs='?', const='-', dest='timings', metavar='FILE',
+                      help='record wall time, peak memory and hits of each stage, and the downloaded pages; print them to stderr, or write them as JSON to FILE')
+    parser.add_argument('--output', dest='output', choices=output_formats, default='text',
+                      help='output format: text, json, csv, ndjson; default: text')
+    parser.add_argument('-o', '--output-file', dest='output_file',
+                      help='write the output to a file instead of stdout')
+
+    args = parser.parse_args(argv)
+
+    if args.BAI == 'default':
+        parser.error("No default BAI found in config.ini; please specify one using -b.")
+
+    check_selection_arguments(parser, args)
+    if args.max_age < 0:
+        parser.error('The maximum age cannot be negative.')
+    if args.normalized and not os.path.exists(args.normalized):
+        parser.error(f'No reference distributions found in {args.normalized}; please build them first with reference.py.')
+
+    # Size of the cache of the results, in MB; zero disables it
+    args.cache_size = 0 if args.no_cache else get_cache_size(config)
+
+    # Save BAI as default in config.ini if it was provided and is not already set
+    if default_BAI == 'default' and args.BAI != 'default':
+        config['DEFAULT']['BAI'] = args.BAI
+        with open('config.ini', 'w') as configfile:
+            config.write(configfile)
+        print(f"{args.BAI} saved as default BAI in config.ini.")
+
+    return args
@@ -0,0 +1,131 @@
+# Selection and computation of the report, shared by citations.py and batch.py
+
+# Import datetime to set the current year
+from datetime import datetime
+
+# Dataclass and arrays to compute the citation metrics for published papers
+from dataclasses import dataclass
+import numpy as np
+
+from timings import stage
+
+@dataclass
+class Citations:
+    cits: np.ndarray
+    cits_noself: np.ndarray
+    authors: np.ndarray
+    age: np.ndarray
+
+    # Take the arrays from the columns of the profile, optionally masked
+    @classmethod
+    def from_columns(cls, data, mask=None, dtype=int):
+        mask = slice(None) if mask is None else mask
+        return cls(data.citation_count[mask].astype(dtype),
+            data.citation_count_without_self_citations[mask].astype(dtype),
+            data.author_count[mask].astype(dtype),
+            data.age[mask].astype(dtype))
+
+    # Return the arrays as a dictionary
+    def to_numpy(self):
+        return {'cits': self.cits, 'cits_noself': self.cits_noself, 'authors': self.authors, 'age': self.age}
+
+
+# Select the hits of the profile
+def select_profile(data, collection='article', given_year=None, latest_years=None, number_of_authors=None, order=False):
+    from selection import select_collection, select_interval, select_lessauthors, apply_selection
+
+    current_year = datetime.today().year
+
+    masks = [select_collection(data, collection)]
+
+    if number_of_authors:
+        masks.append(select_lessauthors(data, number_of_authors))
+
+    if latest_years:
+        range_years = range(current_year-latest_years+1, current_year+1)
+        masks.append(select_interval(data, range_years))
+
+    if given_year:
+        range_years = range(given_year, given_year+1)
+        masks.append(select_interval(data, range_years))
+
+    data = apply_selection(data, *masks)
+
+    # Sorting: default is from most recent
+    if order:
+        data = data[::-1]
+
+    return data
+
+
+# Compute the totals, the citation metrics and the breakdown of the selected hits, which must not be empty
+def compute_report(data):
+    from selection import get_years_range
+    from metrics import compute_metrics
+    from summary import compute_breakdown
+
+    # Year of the first and last hits
+    first_year, last_year, active_years = get_years_range(data)
+
+    with stage('accumulate citations') as record:
+        cits_total = Citations.from_columns(data).to_numpy()
+        cits_citeable = Citations.from_columns(data, data.citeable).to_numpy()
+        cits_published = Citations.from_columns(data, data.refereed).to_numpy()
+
+        # Count the number of citations and citations excluding self cites
+        citations = {'total': {'total': np.sum(cits_total['cits']), 'noself': np.sum(cits_total['cits_noself'])},
+            'published': {'total': np.sum(cits_published['cits']), 'noself': np.sum(cits_published['cits_noself'])},
+            'citeable': {'total': np.sum(cits_citeable['cits']), 'noself': np.sum(cits_citeable['cits_noself'])}}
+        record['hits'] = cits_total['cits'].size
+
+    # Compute some citation metrics https://en.wikipedia.org/wiki/Author-level_metrics
+    # In this case they are computed for the published data
+    with stage('compute_metrics') as record:
+        indices = compute_metrics(cits_published, active_years)
+        record['hits'] = cits_published['cits'].size
+
+    # Breakdown of papers by citations
+    with stage('breakdown_citations') as record:
+        breakdown = compute_breakdown(cits_citeable['cits'], cits_citeable['cits_noself'], cits_published['cits'], cits_published['cits_noself'])
+        record['hits'] = cits_citeable['cits'].size
+
+    return {'first_year': first_year, 'last_year': last_year, 'active_years': active_years,
+        'total_hits': cits_total['cits'].size,
+        'total_hits_citeable': cits_citeable['cits'].size,
+        'total_hits_published': cits_published['cits'].size,
+        'mean_citations': [np.mean(cits_published['cits']), np.mean(cits_published['cits_noself'])] if cits_published['cits'].size else None,
+        'citations': citations,
+        'indices': indices,
+        'breakdown': breakdown}
+
+
+# Compute the indices of the published papers up to each year, and the number of hits per year
+def compute_timeline_report(data):
+    from selection import get_years_range
+    from metrics import compute_timeline
+    from summary import count_documents_per_year
+
+    first_year, last_year, _ = get_years_range(data)
+    cits_published = Citations.from_columns(data, data.refereed).to_numpy()
+    with stage('compute_timeline') as record:
+        timeline = compute_timeline(cits_published, data.year[data.refereed], first_year, last_year)
+        record['hits'] = cits_published['cits'].size
+    documents = count_documents_per_year(data)
+    for entry in timeline:
+        entry['documents_in_year'] = documents.get(entry['year'], 0)
+    return timeline
+
+
+# Compute the report, or take it from the cache of the results if the same selection of the same snapshot was already computed
+def get_report(data, BAI, selection, cache=None):
+    if cache is None or data.snapshot is None:
+        return compute_report(data)
+    # The selection of the latest years depends on the current year
+    key = cache.key(BAI, data.snapshot, current_year=datetime.today().year, **selection)
+    with stage('cached report lookup') as record:
+        report = cache.get(key)
+        record['hits'] = 1 if report is not None else 0
+    if report is None:
+        report = compute_report(data)
+        cache.put(key, report)
+    return report
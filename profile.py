@@ -4,6 +4,11 @@ from datetime import datetime
 import json
 
 
+# Requests per second and burst of the downloads, within the limits of INSPIRE
+download_rate = 3
+download_burst = 5
+
+
 # Get the hit date
 def get_hit_date(hit):
     earliest_date = int(hit['metadata']['earliest_date'][:4])
@@ -13,80 +18,359 @@ def get_hit_date(hit):
     # Notice that inspirehep.net uses 'earliest_date'
 
 
-# Download the profile and save it locally
-def download_profile(BAI):
-    # Import the module to open and read URLs
-    import requests
+# Error raised when the download fails; the pages fetched so far are kept to resume it
+class DownloadError(Exception):
+    pass
+
+
+# Fetch the pages concurrently and yield their hits in page order
+def fetch_pages(fetch_page, pages, workers=4, window=None, first_page=1):
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Bound the number of pages in flight, so that memory does not grow with the profile size
+    window = window or 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        next_page = first_page
+        try:
+            while pending or next_page <= pages:
+                while next_page <= pages and len(pending) < window:
+                    pending.append(executor.submit(fetch_page, next_page))
+                    next_page += 1
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Open a query on the INSPIRE-HEP API; return the number of hits and a function fetching a page
+def open_query(query, transport, limiter, page_size=50, fields=None):
+    from time import perf_counter
+    from timings import record_page
+    from transport import INSPIRE_API, get_with_retries
+
+    total_hits = get_with_retries(transport, INSPIRE_API, {'q': query, 'size': 1, 'fields': 'control_number'}, limiter)[0]['hits']['total']
+
+    params = {'q': query, 'sort': 'mostrecent', 'size': page_size}
+    if fields:
+        params['fields'] = ','.join(fields)
+
+    def fetch_page(page_number):
+        start = perf_counter()
+        response, retries = get_with_retries(transport, INSPIRE_API, {**params, 'page': page_number}, limiter)
+        record_page(page_number, perf_counter() - start, getattr(transport, 'last_response_bytes', None), retries)
+        return response['hits']['hits']
+
+    # Load the data in pages to avoid 502-bad-gateway server error for large literature
+    pages = 1 + total_hits // page_size
+    return total_hits, pages, fetch_page
+
+
+# Pages downloaded so far, saved one per line in a partial file to resume an interrupted download
+# The first line describes the query; the pages are reused only for the same query and number of hits
+class Checkpoint:
+    def __init__(self, filename, header):
+        self.filename = filename
+        self.hits = []
+        self.next_page = 1
+        # Length of the valid part of the file
+        size = 0
+
+        try:
+            with open(filename, 'rb') as f:
+                line = f.readline()
+                if json.loads(line) == header:
+                    size = len(line)
+                    for line in f:
+                        # The last line is incomplete if the download was killed while writing it
+                        try:
+                            page = json.loads(line)
+                        except ValueError:
+                            break
+                        if page['page'] != self.next_page:
+                            break
+                        self.hits += page['hits']
+                        self.next_page += 1
+                        size += len(line)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if size:
+            # Drop anything after the valid pages
+            self.file = open(filename, 'r+b')
+            self.file.truncate(size)
+            self.file.seek(size)
+        else:
+            self.file = open(filename, 'wb')
+            self.file.write(json.dumps(header).encode() + b'\n')
+            self.file.flush()
+
+    # Save a page as soon as it is processed
+    def append(self, page_number, hits):
+        self.file.write(json.dumps({'page': page_number, 'hits': hits}, ensure_ascii=False).encode() + b'\n')
+        self.file.flush()
+        self.next_page = page_number + 1
+
+    def close(self):
+        self.file.close()
+
+    # Remove the partial file once the profile is saved
+    def remove(self):
+        import os
+        self.file.close()
+        os.remove(self.filename)
+
+
+# Fetch all the pages of a query, in order, with a progress bar
+# Each page is processed as it arrives, so that only the processed hits are kept in memory;
+# with a checkpoint, the pages already fetched are skipped and the new ones are saved
+def fetch_all(fetch_page, pages, workers, desc='Downloading data', process=None, checkpoint=None):
     # Import tqdm for the progress bar
     from tqdm import tqdm
-    # Import sleep
-    from time import sleep
+
+    data = checkpoint.hits if checkpoint else []
+    first_page = checkpoint.next_page if checkpoint else 1
+    with tqdm(total=pages, initial=first_page - 1, desc=desc, unit='page') as pbar:
+        for page_number, hits in enumerate(fetch_pages(fetch_page, pages, workers, first_page=first_page), first_page):
+            hits = [process(hit) for hit in hits] if process else hits
+            if checkpoint:
+                checkpoint.append(page_number, hits)
+            data += hits
+            pbar.update(1)
+    return data
+
+
+# Metadata fields read by the scripts; only these are requested to the server
+metadata_fields = ['control_number', 'titles', 'citation_count', 'citation_count_without_self_citations', 'author_count', 'earliest_date', 'publication_info', 'document_type', 'publication_type', 'refereed', 'citeable']
+
+
+# Fields requested to the server, with the authors and the references in the network mode
+def profile_fields(network=False):
+    if not network:
+        return metadata_fields
+    from network import network_fields
+    return metadata_fields + network_fields
+
+
+# Strip a hit to make a lighter file and add the derived keys
+links_to_remove = ['bibtex', 'latex-eu', 'latex-us', 'json', 'cv']
+keys_to_remove = ['authors', 'references', 'abstracts', 'figures', 'referenced_authors_bais', '$schema', 'inspire_categories', 'public_notes', 'facet_author_name', 'license', 'copyright', 'documents', 'keywords']
+
+# In the network mode the authors and the references are kept, as compact lists, until the profile is saved
+def normalize_hit(hit, current_year, network=False):
+    if network:
+        from network import extract_network
+        hit['_network'] = extract_network(hit['metadata'])
+    for link in links_to_remove:
+        hit.get('links', {}).pop(link, None)
+    for key in keys_to_remove:
+        hit['metadata'].pop(key, None)
+    doc_type = hit['metadata']['document_type']
+    if 'publication_type' in hit['metadata']:
+        doc_type += hit['metadata']['publication_type']
+    doc_type = [doc.replace('conference paper', 'conferencepaper').replace('book chapter', 'bookchapter') for doc in doc_type]
+    hit['metadata']['document_type'] = doc_type
+    set_hit_dates(hit, current_year)
+    return hit
+
+
+# Add the 'publication_or_earliest_date' and 'age_of_publication' keys
+def set_hit_dates(hit, current_year):
+    hit_date = get_hit_date(hit)
+    hit['metadata']['publication_or_earliest_date'] = hit_date
+    hit['metadata']['age_of_publication'] = current_year - hit_date + 1
+
+
+# Save the profile, and its columnar cache next to it; the cached results of the older profile are dropped
+# With a record store, the records are also stored there, with their authors and references if downloaded
+# Only in the network mode the authors and references are saved in {BAI}.network.npz; otherwise they are dropped
+def save_profile(BAI, data, store=None, network=False):
+    import os
+    from columns import ProfileColumns, file_hash
+    from results import ResultCache
+
+    if store is not None:
+        store.put_profile(BAI, data)
+    networks = {hit['metadata']['control_number']: hit.pop('_network') for hit in data if '_network' in hit}
+    if network or has_network(BAI):
+        from network import save_network
+        save_network(BAI, data, networks)
+
+    filename = f'{BAI}.json'
+    # Write to a temporary file first, so that an interrupted save does not leave a broken profile
+    with open(f'{filename}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(f'{filename}.tmp', filename)
+    columns = ProfileColumns.from_hits(data)
+    columns.snapshot = file_hash(filename)
+    columns.save(BAI)
+    ResultCache().invalidate(BAI)
+
+
+# Check if the authors and the references of a profile are kept
+def has_network(BAI):
+    import os
+    return os.path.isfile(f'{BAI}.network.npz')
+
+
+# Load the columns of a local profile; the cache is memory-mapped if it is newer than the JSON file, otherwise it is rebuilt
+# The JSON file is parsed one hit at a time, so that memory does not grow with its size
+def load_columns(BAI):
+    from columns import ProfileColumns, is_cache_fresh, file_hash
+    from jsonstream import iter_array
+
+    filename = f'{BAI}.json'
+    if is_cache_fresh(BAI, filename):
+        try:
+            return ProfileColumns.load(BAI)
+        except (OSError, ValueError):
+            pass
+    with open(filename, 'r', encoding='utf-8') as file:
+        columns = ProfileColumns.from_hits(iter_array(file))
+    columns.snapshot = file_hash(filename)
+    columns.save(BAI)
+    return columns
+
+
+# Download the profile and save it locally
+# The pages are saved in {BAI}.json.partial while downloading, so that a failed download resumes from the last page
+# With a record store, the records already stored for other profiles are not downloaded again, unless full; the records are stored too
+# In the network mode, or if the profile is already kept with its network, the authors and the references are downloaded too
+def download_profile(BAI, transport=None, workers=4, rate=download_rate, burst=download_burst, store=None, network=False, full=False):
+    from transport import RateLimiter, RequestsTransport, TransportError
+
+    if store is not None and not full:
+        return update_profile(BAI, [], None, transport, workers, rate, burst, store, network)
 
     current_year = datetime.today().year
+    network = network or has_network(BAI)
+    fields = profile_fields(network)
+
+    # Pooled keep-alive sessions unless another transport is given, e.g. a local fake server
+    if transport is None:
+        transport = RequestsTransport(pool_size=workers)
+    # To avoid overwhelming the server
+    limiter = RateLimiter(rate, burst)
 
-    # Open the INSPIRE-HEP profile
-    inspirehep_profile = f'https://inspirehep.net/api/literature?q=a+{BAI}'
+    try:
+        # Open the INSPIRE-HEP profile
+        query = f'a {BAI}'
+        total_hits_profile, pages, fetch_page = open_query(query, transport, limiter, fields=fields)
+    except TransportError as e:
+        raise DownloadError(f'Error fetching data: {e}') from e
+
+    # Check if empty
+    if total_hits_profile == 0:
+        raise DownloadError('Empty database. No data saved.')
+
+    # The pages of an interrupted download of the same profile are reused
+    header = {'query': query, 'total': total_hits_profile, 'page_size': 50, 'fields': fields, 'year': current_year}
+    checkpoint = Checkpoint(f'{BAI}.json.partial', header)
+    if checkpoint.next_page > 1:
+        print(f'Resuming the download from page {checkpoint.next_page} of {pages}.')
 
     try:
-        response = requests.get(inspirehep_profile)
-        response.raise_for_status()
-        total_hits_profile = response.json()['hits']['total']
-
-        # Check if empty
-        if total_hits_profile == 0:
-            print('Empty database. No data saved.')
-            exit()
-
-    except requests.exceptions.RequestException as e:
-        print(f'Error fetching data: {e}')
-        exit()
-
-    # Load the data; in pages to avoid 502-bad-gateway server error for large literature
-    data = []
-    page_number = 1
-    page_size = 50
-    pages = 1 + total_hits_profile // page_size
-
-    with tqdm(total=pages, desc='Downloading data', unit='page') as pbar:
-        while page_number <= pages:
-            page = f'{inspirehep_profile}&sort=mostrecent&size={page_size}&page={page_number}'
-            try:
-                response = requests.get(page)
-                response.raise_for_status()
-                data += response.json()['hits']['hits']
-                page_number += 1
-                pbar.update(1)
-                sleep(1)  # To avoid overwhelming the server
-            except requests.exceptions.RequestException as e:
-                print(f'Error fetching data: {e}')
-                exit()
-
-    # Strip the json to make a lighter file
-    links_to_remove = ['bibtex', 'latex-eu', 'latex-us', 'json', 'cv']
-    keys_to_remove = ['authors', 'references', 'abstracts', 'figures', 'referenced_authors_bais', '$schema', 'inspire_categories', 'public_notes', 'facet_author_name', 'license', 'copyright', 'documents', 'keywords']
+        # Pages are merged back in order, so the saved file is the same as the one of a sequential download
+        data = fetch_all(fetch_page, pages, workers, process=lambda hit: normalize_hit(hit, current_year, network), checkpoint=checkpoint)
+    except TransportError as e:
+        checkpoint.close()
+        raise DownloadError(f'Error fetching data: {e}; {checkpoint.next_page - 1} of {pages} pages saved, run again to resume') from e
+
+    # Records moved to a later page between two runs would appear twice
+    seen = set()
+    unique_data = []
     for hit in data:
-        for link in links_to_remove:
-            hit['links'].pop(link, None)
-        for key in keys_to_remove:
-            hit['metadata'].pop(key, None)
-        doc_type = hit['metadata']['document_type']
-        if 'publication_type' in hit['metadata']:
-            doc_type += hit['metadata']['publication_type']
-        doc_type = [doc.replace('conference paper', 'conferencepaper').replace('book chapter', 'bookchapter') for doc in doc_type]
-        hit['metadata']['document_type'] = doc_type
-        # Add the 'publication_or_earliest_date' key
-        hit['metadata']['publication_or_earliest_date'] = get_hit_date(hit)
-        # Add the 'age_of_publication' key
-        hit['metadata']['age_of_publication'] = current_year - get_hit_date(hit) + 1
-
-    # Save the profile
-    filename = f'{BAI}.json'
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        control_number = hit['metadata'].get('control_number')
+        if control_number is None or control_number not in seen:
+            seen.add(control_number)
+            unique_data.append(hit)
+    data = unique_data
+
+    save_profile(BAI, data, store, network)
+    checkpoint.remove()
 
     return data
 
 
+# Update a local profile with the records created or modified since its datestamp
+# With a record store, the records of the profile stored for other profiles are used too; a datestamp None with no stored records downloads the whole profile
+def update_profile(BAI, data, datestamp, transport=None, workers=4, rate=download_rate, burst=download_burst, store=None, network=False):
+    from transport import RateLimiter, RequestsTransport, TransportError
+
+    current_year = datetime.today().year
+    network = network or has_network(BAI)
+    fields = profile_fields(network)
+
+    if transport is None:
+        transport = RequestsTransport(pool_size=workers)
+    limiter = RateLimiter(rate, burst)
+
+    # Records keyed by control number
+    records = {hit['metadata']['control_number']: hit for hit in data}
+
+    try:
+        # Current list of records with their citation counts, in large pages with only a few fields
+        citation_fields = ['control_number', 'citation_count', 'citation_count_without_self_citations']
+        _, pages, fetch_page = open_query(f'a {BAI}', transport, limiter, page_size=250, fields=citation_fields)
+        current = fetch_all(fetch_page, pages, workers, desc='Updating citations')
+
+        if not current and not data:
+            raise DownloadError('Empty database. No data saved.')
+
+        if store is not None:
+            stored = store.records(hit['metadata']['control_number'] for hit in current if hit['metadata']['control_number'] not in records)
+            for control_number, (hit, fetched) in stored.items():
+                # The records stored without their network are downloaded again in the network mode
+                if network and '_network' not in hit:
+                    continue
+                records[control_number] = hit
+                # The stored records may be older than the local profile
+                datestamp = min(datestamp, fetched) if datestamp else fetched
+
+        # Full records created or modified since the datestamp of the local profile
+        query = f'a {BAI} and du >= {datestamp:%Y-%m-%d}' if datestamp else f'a {BAI}'
+        _, pages, fetch_page = open_query(query, transport, limiter, fields=fields)
+        modified = fetch_all(fetch_page, pages, workers, desc='Updating records', process=lambda hit: normalize_hit(hit, current_year, network))
+
+    except TransportError as e:
+        raise DownloadError(f'Error fetching data: {e}; the local profile is unchanged') from e
+
+    # Merge the records keyed by control number
+    for hit in modified:
+        records[hit['metadata']['control_number']] = hit
+
+    # Records in the profile which are neither local nor modified, e.g. older papers claimed recently
+    missing = [hit['metadata']['control_number'] for hit in current if hit['metadata']['control_number'] not in records]
+    try:
+        for i in range(0, len(missing), 50):
+            query = ' or '.join(f'recid:{control_number}' for control_number in missing[i:i+50])
+            _, pages, fetch_page = open_query(query, transport, limiter, fields=fields)
+            for hit in fetch_all(fetch_page, pages, workers, desc='Fetching new records', process=lambda hit: normalize_hit(hit, current_year, network)):
+                records[hit['metadata']['control_number']] = hit
+    except TransportError as e:
+        raise DownloadError(f'Error fetching data: {e}; the local profile is unchanged') from e
+
+    # The current list gives the order of the profile and drops the records no longer there
+    updated_data = []
+    for hit in current:
+        metadata = hit['metadata']
+        record = records.get(metadata['control_number'])
+        # A record added while updating is fetched at the next update
+        if record is None:
+            continue
+        record['metadata']['citation_count'] = metadata['citation_count']
+        record['metadata']['citation_count_without_self_citations'] = metadata['citation_count_without_self_citations']
+        # The age of publication changes with the current year
+        set_hit_dates(record, current_year)
+        updated_data.append(record)
+
+    # All the records are now up to date
+    save_profile(BAI, updated_data, store, network)
+
+    return updated_data
+
+
 # Ask for update if an older database is present
 def prompt_update(datestamp):
     prompt_string = f'There is an old database with date {datestamp:%B %d, %Y}; do you want to update it? [y/n] '
@@ -97,32 +381,140 @@ def prompt_update(datestamp):
     return update == 'y'
 
 
-# Load data from local file, check for updates, or download it
-def load_profile(BAI):
+# What to do with a database older than the maximum age: ask, update it, use it, or use it and update it in the background for the next run
+refresh_policies = ['ask', 'always', 'never', 'background']
+
+
+# Date of a local database, or None if it is missing
+def get_datestamp(filename):
     import os
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(filename)).date()
+    except OSError:
+        return None
+
+
+# A database is fresh if it is at most max_age days old; with the default 0 only a database from today is fresh
+def is_fresh(datestamp, max_age=0):
+    return (datetime.today().date() - datestamp).days <= max_age
 
+
+# Update a profile without asking, or download it again if not incremental
+def refresh_profile(BAI, incremental=True, store=None, rate=download_rate, burst=download_burst):
     filename = f'{BAI}.json'
-    current_date = datetime.today().date()
-
-    # Check if a database is present
-    if os.path.isfile(filename):
-        # Check datestamp
-        timestamp = os.path.getmtime(filename)
-        datestamp = datetime.fromtimestamp(timestamp).date()
-        # If the database has been downloaded today use it
-        if datestamp == current_date:
-            with open(filename, 'r') as file:
-                data = json.load(file)
-        # Otherwise ask for updates first, if answer is no use the current database
-        else:
-            if not prompt_update(datestamp):
+    datestamp = get_datestamp(filename)
+    if incremental and datestamp is not None:
+        with open(filename, 'r') as file:
+            data = json.load(file)
+        return update_profile(BAI, data, datestamp, rate=rate, burst=burst, store=store)
+    return download_profile(BAI, rate=rate, burst=burst, store=store, full=True)
+
+
+# Update profiles in one detached process, which outlives the current run, one after the other; return the BAIs queued
+# A profile already being updated is skipped; the lock file is left by a crashed update, and ignored, after an hour
+def refresh_in_background(BAIs, incremental=True, store=None):
+    import os
+    import subprocess
+    import sys
+    import time
+
+    queued = []
+    for BAI in BAIs:
+        lock = f'{BAI}.json.refresh'
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            if time.time() - os.path.getmtime(lock) < 3600:
+                continue
+            os.utime(lock)
+        queued.append(BAI)
+    if not queued:
+        return queued
+
+    # The messages of each update go to its own log, the errors of the process to the first one
+    for BAI in queued:
+        open(f'{BAI}.json.refresh.log', 'w').close()
+    code = 'import sys; sys.path.insert(0, sys.argv[1]); from profile import refresh_worker; refresh_worker(*sys.argv[2:])'
+    with open(f'{queued[0]}.json.refresh.log', 'a') as log:
+        subprocess.Popen([sys.executable, '-c', code, os.path.dirname(os.path.abspath(__file__)), '1' if incremental else '0', store or '', *queued],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+    return queued
+
+
+# Entry point of the background updates; the messages of each profile go to {BAI}.json.refresh.log
+# A failed update does not stop the others; the locks of the profiles still waiting are kept from expiring
+def refresh_worker(incremental, store, *BAIs):
+    import os
+    import traceback
+    from contextlib import redirect_stderr, redirect_stdout
+
+    record_store = None
+    if store:
+        from store import RecordStore
+        record_store = RecordStore(store)
+    try:
+        for i, BAI in enumerate(BAIs):
+            for waiting in BAIs[i+1:]:
+                os.utime(f'{waiting}.json.refresh')
+            with open(f'{BAI}.json.refresh.log', 'a') as log, redirect_stdout(log), redirect_stderr(log):
+                try:
+                    refresh_profile(BAI, incremental == '1', record_store)
+                except DownloadError as e:
+                    print(e)
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    os.remove(f'{BAI}.json.refresh')
+    finally:
+        if record_store is not None:
+            record_store.close()
+
+
+# Load data from local file, check for updates, or download it; return the columns of the profile
+# A database older than max_age days is handled by the refresh policy; the default asks for updates
+# With a record store file, a profile missing locally is taken from the store, and downloads skip the records already stored
+# In the network mode a profile kept without its authors and references is downloaded again
+# The rate and the burst of the downloads are lower when several processes download at the same time
+def load_profile(BAI, incremental=True, refresh='ask', max_age=0, store=None, network=False, rate=download_rate, burst=download_burst):
+    import os
+
+    filename = f'{BAI}.json'
+    store_file = store
+
+    if store is not None:
+        from store import RecordStore
+        store = RecordStore(store)
+        # Export the stored profile, dated as when it was stored
+        updated = store.updated(BAI)
+        if not os.path.isfile(filename) and updated is not None:
+            save_profile(BAI, store.profile(BAI))
+            timestamp = datetime.combine(updated, datetime.min.time()).timestamp()
+            os.utime(filename, (timestamp, timestamp))
+
+    try:
+        # Check if a database is present
+        datestamp = get_datestamp(filename)
+        if datestamp is not None and network and not has_network(BAI):
+            print('Downloading the authors and the references of the profile.')
+            download_profile(BAI, rate=rate, burst=burst, store=store, network=True)
+        elif datestamp is not None:
+            # If the database is recent enough, or it should not be updated, use it
+            if is_fresh(datestamp, max_age) or refresh == 'never':
+                pass
+            # The old database is used now, the next run finds it updated
+            elif refresh == 'background':
+                if refresh_in_background([BAI], incremental, store_file):
+                    print(f'Using the database with date {datestamp:%B %d, %Y}; it is being updated in the background.')
+            # Otherwise ask for updates first, if answer is no use the current database
+            elif refresh == 'ask' and not prompt_update(datestamp):
                 print('Database not updated.')
-                with open(filename, 'r') as file:
-                    data = json.load(file)
             else:
-                data = download_profile(BAI)
-    # Otherwise download it
-    else:
-        data = download_profile(BAI)
+                refresh_profile(BAI, incremental, store, rate, burst)
+        # Otherwise download it
+        else:
+            download_profile(BAI, rate=rate, burst=burst, store=store, network=network)
+    finally:
+        if store is not None:
+            store.close()
 
-    return data
+    return load_columns(BAI)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+Reference distributions of the citations by year and document type, built once from
+the stored profiles and kept as sorted integer arrays in reference.npz: the citations of
+a paper are normalized by its year and document type with a binary search.
+"""
+
+import argparse
+import os
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+# Default location of the reference distributions
+reference_file = 'reference.npz'
+
+# Bump when the layout changes, so that older files are rebuilt
+REFERENCE_VERSION = 2
+
+# Papers at or above this percentile are in the top 10%
+TOP_PERCENTILE = 90
+
+
+@dataclass
+class ReferenceDistributions:
+    # Document types, sorted; the cells are sorted by document type and year
+    document_types: np.ndarray
+    cell_types: np.ndarray
+    cell_years: np.ndarray
+    # Citations of the papers of each cell, sorted within the cell
+    indptr: np.ndarray
+    citations: np.ndarray
+    citations_noself: np.ndarray
+
+    # Build the cells from the columns of several profiles; the papers shared by the profiles are counted once
+    # A paper with several document types is in the cell of each of them
+    @classmethod
+    def from_columns(cls, profiles):
+        control_numbers = np.concatenate([data.records['control_number'] for data in profiles]) if profiles else np.zeros(0, dtype=np.int64)
+        first = np.zeros(control_numbers.size, dtype=bool)
+        first[np.unique(control_numbers, return_index=True)[1]] = True
+        # Papers with no control number cannot be matched, they are all kept
+        first |= control_numbers < 0
+
+        document_types = sorted({doc for data in profiles for doc in data.document_types})
+        types, years, cits, cits_noself = [], [], [], []
+        offset = 0
+        for data in profiles:
+            keep = first[offset:offset + len(data)]
+            offset += len(data)
+            for doc in data.document_types:
+                mask = keep & data.has_document_type(doc)
+                types.append(np.full(np.count_nonzero(mask), document_types.index(doc), dtype=np.int64))
+                years.append(data.year[mask].astype(np.int64))
+                cits.append(data.citation_count[mask].astype(np.int64))
+                cits_noself.append(data.citation_count_without_self_citations[mask].astype(np.int64))
+        types, years, cits, cits_noself = (np.concatenate(values) if values else np.zeros(0, dtype=np.int64) for values in (types, years, cits, cits_noself))
+
+        # One sort by cell and citations; the citations without self cites are sorted separately within each cell
+        order = np.lexsort((cits, years, types))
+        order_noself = np.lexsort((cits_noself, years, types))
+        types, years, cits = types[order], years[order], cits[order]
+        starts = np.flatnonzero(np.r_[True, (types[1:] != types[:-1]) | (years[1:] != years[:-1])]) if types.size else np.zeros(0, dtype=np.int64)
+        return cls(np.array(document_types, dtype=str), types[starts], years[starts], np.r_[starts, types.size],
+            cits.astype(np.int32), cits_noself[order_noself].astype(np.int32))
+
+    # The values of the cells are offset by cell, so that one binary search covers all the papers; the means of the cells
+    def __post_init__(self):
+        lengths = np.diff(self.indptr)
+        self.lookup = {}
+        for noself, reference in [(False, self.citations), (True, self.citations_noself)]:
+            scale = int(reference.max(initial=0)) + 1
+            sums = np.r_[0, np.cumsum(reference, dtype=np.int64)]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = (sums[self.indptr[1:]] - sums[self.indptr[:-1]]) / lengths
+            self.lookup[noself] = (scale, np.repeat(np.arange(lengths.size, dtype=np.int64), lengths) * scale + reference, means)
+
+    def __len__(self):
+        return self.cell_types.size
+
+    # Cell of each paper for a document type, -1 if the reference has no paper of that type and year
+    def cells(self, doc, years):
+        years = np.asarray(years, dtype=np.int64)
+        type_index = np.searchsorted(self.document_types, doc)
+        first, last = np.searchsorted(self.cell_types, [type_index, type_index + 1])
+        if first == last or self.document_types[type_index] != doc:
+            return np.full(years.size, -1)
+        positions = first + np.searchsorted(self.cell_years[first:last], years)
+        found = (positions < last) & (self.cell_years[np.minimum(positions, last - 1)] == years)
+        return np.where(found, positions, -1)
+
+    # Percentile of the citations of each paper within its cell, counting ties as half, and the ratio to the mean of the cell
+    def normalize(self, cells, values, noself=False):
+        scale, keys, means = self.lookup[noself]
+        values = np.asarray(values, dtype=np.int64)
+        percentile = np.full(values.size, np.nan)
+        score = np.full(values.size, np.nan)
+        found = cells >= 0
+        cells, values = cells[found], values[found]
+        # Values above the largest one of the reference are above all the values of their cell
+        query = cells * scale + np.minimum(values, scale - 1)
+        below = np.where(values < scale, np.searchsorted(keys, query, 'left'), self.indptr[cells + 1])
+        up_to = np.where(values < scale, np.searchsorted(keys, query, 'right'), self.indptr[cells + 1])
+        percentile[found] = 100 * (below - self.indptr[cells] + 0.5 * (up_to - below)) / (self.indptr[cells + 1] - self.indptr[cells])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score[found] = np.where(means[cells] > 0, values / means[cells], np.nan)
+        return percentile, score
+
+    # Cells found by a direct sort of the papers of each cell, which differ from the stored ones; empty if the reference is consistent
+    def check(self, profiles):
+        expected = {}
+        seen = set()
+        for data in profiles:
+            for i, control_number in enumerate(data.records['control_number'].tolist()):
+                if control_number in seen:
+                    continue
+                if control_number >= 0:
+                    seen.add(control_number)
+                for doc in data.document_types:
+                    if data.has_document_type(doc)[i]:
+                        values = expected.setdefault((doc, int(data.year[i])), ([], []))
+                        values[0].append(int(data.citation_count[i]))
+                        values[1].append(int(data.citation_count_without_self_citations[i]))
+        cells = {(str(self.document_types[doc]), int(year)): k for k, (doc, year) in enumerate(zip(self.cell_types, self.cell_years))}
+        wrong = list(cells.keys() - expected.keys())
+        for cell, (cits, cits_noself) in expected.items():
+            k = cells.get(cell)
+            if k is None or any(reference[self.indptr[k]:self.indptr[k+1]].tolist() != sorted(values)
+                    for reference, values in [(self.citations, cits), (self.citations_noself, cits_noself)]):
+                wrong.append(cell)
+        return sorted(wrong)
+
+    def save(self, filename=reference_file):
+        with open(f'{filename}.tmp', 'wb') as f:
+            np.savez(f, version=REFERENCE_VERSION, **{name: getattr(self, name) for name in self.__dataclass_fields__})
+        os.replace(f'{filename}.tmp', filename)
+
+    @classmethod
+    def load(cls, filename=reference_file):
+        with np.load(filename, allow_pickle=False) as arrays:
+            if arrays['version'] != REFERENCE_VERSION:
+                raise ValueError(f'Reference version {arrays["version"]} not supported.')
+            return cls(**{name: arrays[name] for name in cls.__dataclass_fields__})
+
+
+# Percentiles and normalized citation scores of the papers, with and without self cites
+# A paper with several document types takes the mean over the cells found in the reference
+def normalize_papers(data, reference):
+    values = {False: data.citation_count, True: data.citation_count_without_self_citations}
+    sums = {(name, noself): np.zeros(len(data)) for name in ['percentile', 'score', 'percentile_count', 'score_count'] for noself in values}
+    for doc in data.document_types:
+        mask = data.has_document_type(doc)
+        cells = np.full(len(data), -1)
+        cells[mask] = reference.cells(doc, data.year[mask])
+        for noself in values:
+            for name, normalized in zip(['percentile', 'score'], reference.normalize(cells, values[noself], noself)):
+                sums[name, noself] += np.nan_to_num(normalized)
+                sums[f'{name}_count', noself] += ~np.isnan(normalized)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {f'{name}{"_noself" if noself else ""}': sums[name, noself] / sums[f'{name}_count', noself]
+            for name in ['percentile', 'score'] for noself in values}
+
+
+# Mean normalized citation score, mean percentile and share of papers in the top 10% of the selected papers,
+# each with and without self cites; the papers with no reference cell are left out
+def normalized_indicators(data, reference):
+    papers = normalize_papers(data, reference)
+    indicators = {'papers': len(data), 'papers_with_reference': int(np.count_nonzero(~np.isnan(papers['percentile'])))}
+    mean = lambda values: float(np.mean(values[~np.isnan(values)])) if np.any(~np.isnan(values)) else None
+    top = lambda values: float(np.mean(values[~np.isnan(values)] >= TOP_PERCENTILE)) if np.any(~np.isnan(values)) else None
+    indicators['indicators'] = {
+        'MNCS': [mean(papers['score']), mean(papers['score_noself'])],
+        'mean percentile': [mean(papers['percentile']), mean(papers['percentile_noself'])],
+        'top 10%': [top(papers['percentile']), top(papers['percentile_noself'])],
+    }
+    return papers, indicators
+
+
+def main(argv=None):
+    from parser import load_config
+
+    config = load_config()
+    parser = argparse.ArgumentParser(description='Build the reference distributions of the citations by year and document type from the stored profiles.')
+    parser.add_argument('BAIs', nargs='*', help='profiles in the current directory, e.g. E.Franzin.1')
+    parser.add_argument('--store', dest='store', metavar='FILE', default=config['DEFAULT'].get('record_store'),
+                      help='add all the records of the store; default: record_store in config.ini')
+    parser.add_argument('-o', '--output', dest='output', default=config['DEFAULT'].get('reference', reference_file),
+                      help=f'file of the reference distributions; default: reference in config.ini, or {reference_file}')
+    parser.add_argument('--check', action='store_true', dest='check',
+                      help='compare every cell with a direct sort of its papers before saving')
+    args = parser.parse_args(argv)
+
+    from columns import ProfileColumns
+    from profile import load_columns
+    profiles = [load_columns(BAI) for BAI in args.BAIs]
+    if args.store:
+        from store import RecordStore
+        with RecordStore(args.store) as store:
+            profiles.append(ProfileColumns.from_hits(store.hits()))
+    if not any(len(data) for data in profiles):
+        parser.error('No papers found; please give the BAIs of local profiles or a record store.')
+
+    reference = ReferenceDistributions.from_columns(profiles)
+    if args.check:
+        wrong = reference.check(profiles)
+        if wrong:
+            sys.exit(f"{len(wrong)} of {len(reference)} cells differ from a direct sort, e.g. {', '.join(f'{doc} {year}' for doc, year in wrong[:5])}; nothing saved.")
+        print(f'All {len(reference)} cells match a direct sort of their papers.')
+    reference.save(args.output)
+    print(f'{reference.indptr[-1]} papers in {len(reference)} cells of {reference.document_types.size} document types saved to {args.output}.')
+
+
+if __name__ == '__main__':
+    main()
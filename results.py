@@ -0,0 +1,80 @@
+# Persistent cache of the computed reports, keyed by the content hash of the profile and the selection
+import hashlib
+import json
+import os
+import re
+
+# Default location and maximum size of the cache
+cache_directory = '.citations_cache'
+cache_size = 64 * 2**20
+
+
+class ResultCache:
+    def __init__(self, directory=cache_directory, max_size=cache_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    # One file per entry: the BAI, to drop the entries of a profile, and the hash of the snapshot and of the selection
+    def key(self, BAI, snapshot, **selection):
+        digest = hashlib.sha256(json.dumps([snapshot, selection], sort_keys=True).encode()).hexdigest()[:32]
+        return f'{BAI}-{digest}'
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # The modification time marks the last use, for the LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        from output import to_python
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False, default=to_python)
+        os.replace(f'{path}.tmp', path)
+        self.evict()
+
+    # Remove the least recently used entries until the cache fits in its maximum size
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                # Another process may remove the entry meanwhile
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+    # Remove all the entries of a profile
+    def invalidate(self, BAI):
+        if not os.path.isdir(self.directory):
+            return
+        pattern = re.compile(re.escape(BAI) + r'-[0-9a-f]{32}\.json')
+        for entry in os.scandir(self.directory):
+            if pattern.fullmatch(entry.name):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
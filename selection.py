@@ -1,28 +1,39 @@
+import numpy as np
+
+# The selections return boolean masks over the columns of the profile, see columns.py;
+# the masks are combined with & and the hits are copied only once, by apply_selection
+
 # Select the collection
 def select_collection(data, x):
-    return data if x == 'all' else [hit for hit in data if x in hit['metadata'].get('document_type', [])]
+    return np.ones(len(data), dtype=bool) if x == 'all' else data.has_document_type(x)
 
 
 # Select published (refereed) hits
 def select_published(data):
-    return [hit for hit in data if 'refereed' in hit['metadata']]
+    return data.refereed
 
 
 # Select the interval
 def select_interval(data, range_years):
-    return [hit for hit in data if hit['metadata']['publication_or_earliest_date'] in range_years]
+    return (data.year >= range_years.start) & (data.year < range_years.stop)
 
 
 # Select the hits with n authors or less
 def select_lessauthors(data, n):
-    return [hit for hit in data if hit['metadata']['author_count'] <= n]
+    return data.author_count <= n
+
+
+# Combine the masks and select the hits
+def apply_selection(data, *masks):
+    if not masks:
+        return data
+    return data[np.logical_and.reduce(masks)]
 
 
 # Get the year range of publications
 def get_years_range(data):
-    years = [hit['metadata']['publication_or_earliest_date'] for hit in data]
-    first_year = min(years)
-    last_year = max(years)
+    first_year = int(data.year.min())
+    last_year = int(data.year.max())
     active_years = last_year - first_year + 1
     return first_year, last_year, active_years
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""
+Long-running query server over the local profiles: the columns of each profile are
+loaded once and kept in memory, and the reports are served as JSON over HTTP, on a
+TCP port or a Unix socket. A profile is reloaded when its JSON file changes.
+"""
+
+import argparse
+import json
+import os
+import re
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from parser import collections, load_config
+
+# BAIs are used as file names: no path separators, no hidden files
+valid_BAI = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9._-]*')
+
+# Escape sequences of the formatted warnings
+ansi_escape = re.compile(r'\033\[[0-9;]*m')
+
+
+class QueryError(Exception):
+    pass
+
+
+class ProfileNotFound(QueryError):
+    pass
+
+
+# Columns of the profiles in memory, keyed by BAI; a profile is loaded again when the size or the mtime of BAI.json changes
+class Profiles:
+    def __init__(self):
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    def get(self, BAI):
+        from profile import load_columns
+
+        try:
+            stat = os.stat(f'{BAI}.json')
+        except OSError:
+            raise ProfileNotFound(f'No local database for {BAI}.')
+        signature = (stat.st_mtime_ns, stat.st_size)
+        # One load per profile at a time, the others wait for it
+        with self.lock:
+            lock = self.locks.setdefault(BAI, threading.Lock())
+        with lock:
+            loaded = self.profiles.get(BAI)
+            if loaded is None or loaded[0] != signature:
+                loaded = (signature, load_columns(BAI))
+                with self.lock:
+                    self.profiles[BAI] = loaded
+        return loaded[1]
+
+    # Loaded profiles, with the number of hits and the snapshot hash
+    def summary(self):
+        with self.lock:
+            profiles = sorted(self.profiles.items())
+        return [{'BAI': BAI, 'hits': len(data), 'snapshot': data.snapshot} for BAI, (_, data) in profiles]
+
+
+# Selection from the query string, with the options of citations.py
+def parse_query(query, default_collection='article'):
+    parameters = {key: values[-1] for key, values in parse_qs(query).items()}
+    BAI = parameters.get('BAI')
+    if not BAI or not valid_BAI.fullmatch(BAI):
+        raise QueryError('Missing or invalid BAI.')
+
+    def integer(name):
+        try:
+            return int(parameters[name]) if parameters.get(name) else None
+        except ValueError:
+            raise QueryError(f'{name} must be an integer.')
+
+    selection = {'collection': parameters.get('collection', default_collection), 'given_year': integer('year'),
+        'latest_years': integer('latest'), 'number_of_authors': integer('authors')}
+    if selection['collection'] not in collections:
+        raise QueryError(f"Collection not valid. Please select one among: {', '.join(collections)}.")
+    if selection['given_year'] and selection['latest_years']:
+        raise QueryError('year is not allowed with latest.')
+    order = parameters.get('order', '').lower() in ('1', 'true', 'yes')
+    return BAI, selection, order
+
+
+# Papers, totals, indices and breakdown of a selection, as in the JSON output of citations.py
+def report(profiles, BAI, selection, order=False):
+    from output import paper_records, summary_dict
+    from pipeline import compute_report, select_profile
+    from selection import warnings
+
+    data = select_profile(profiles.get(BAI), order=order, **selection)
+    papers = []
+    for record in paper_records(data):
+        del record['record']
+        papers.append(record)
+    warning = warnings(data, selection['number_of_authors'], selection['latest_years'], selection['given_year'], selection['collection'])
+    if warning:
+        return {'papers': papers, 'selection': {'BAI': BAI, **selection}, 'warning': ansi_escape.sub('', warning)}
+    return {'papers': papers, **summary_dict(compute_report(data), {'BAI': BAI, **selection})}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    profiles = None
+    default_collection = 'article'
+    quiet = False
+
+    def do_GET(self):
+        from output import to_python
+
+        url = urlsplit(self.path)
+        try:
+            if url.path == '/report':
+                BAI, selection, order = parse_query(url.query, self.default_collection)
+                status, body = 200, report(self.profiles, BAI, selection, order)
+            elif url.path == '/profiles':
+                status, body = 200, {'profiles': self.profiles.summary()}
+            else:
+                status, body = 404, {'error': f'Unknown path {url.path}; use /report or /profiles.'}
+        except ProfileNotFound as e:
+            status, body = 404, {'error': str(e)}
+        except QueryError as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            status, body = 500, {'error': f'{type(e).__name__}: {e}'}
+
+        content = json.dumps(body, ensure_ascii=False, default=to_python).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    # Unix sockets have no client address
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # The HTTP handler expects a host and a port
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+# Server on a Unix socket if given, otherwise on host and port; the handlers share the profiles
+def make_server(profiles, host='127.0.0.1', port=8000, socket_path=None, default_collection='article', quiet=False):
+    handler = type('Handler', (QueryHandler,), {'profiles': profiles, 'default_collection': default_collection, 'quiet': quiet})
+    if socket_path:
+        # A socket left by a previous server is replaced
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    config = load_config()
+    parser = argparse.ArgumentParser(description='Serve the reports of the local profiles as JSON, keeping the profiles in memory.')
+    parser.add_argument('BAIs', nargs='*', help='profiles loaded at startup; the others are loaded at their first query')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on; default: 127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='port to listen on; default: 8000')
+    parser.add_argument('--socket', dest='socket_path', metavar='PATH', help='listen on a Unix socket instead of a TCP port')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log the requests')
+    args = parser.parse_args(argv)
+
+    profiles = Profiles()
+    for BAI in args.BAIs:
+        try:
+            profiles.get(BAI)
+        except QueryError as e:
+            parser.error(str(e))
+
+    server = make_server(profiles, args.host, args.port, args.socket_path, config['DEFAULT'].get('collection', 'article'), args.quiet)
+    print(f"Serving {len(args.BAIs)} profiles on {args.socket_path or f'http://{args.host}:{args.port}'}; queries: /report?BAI=...&collection=...&year=...&latest=...&authors=...&order=1, /profiles", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket_path and os.path.exists(args.socket_path):
+            os.remove(args.socket_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Local store of the literature records shared by several profiles: each record is kept once, the profiles list their records
+import json
+import sqlite3
+from datetime import date
+
+# Default location of the store
+store_file = 'records.sqlite'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS records (control_number INTEGER PRIMARY KEY, fetched TEXT NOT NULL, hit TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS profiles (BAI TEXT PRIMARY KEY, updated TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS authorship (BAI TEXT NOT NULL, position INTEGER NOT NULL, control_number INTEGER NOT NULL, PRIMARY KEY (BAI, position));
+CREATE INDEX IF NOT EXISTS authorship_control_number ON authorship (control_number);
+'''
+
+
+class RecordStore:
+    def __init__(self, filename=store_file):
+        self.filename = filename
+        # Several processes can share the store; a writer waits for the others
+        self.connection = sqlite3.connect(filename, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Stored records among the given control numbers, with the date they were fetched
+    def records(self, control_numbers, chunk_size=500):
+        control_numbers = list(control_numbers)
+        found = {}
+        for i in range(0, len(control_numbers), chunk_size):
+            chunk = control_numbers[i:i+chunk_size]
+            rows = self.connection.execute(
+                f"SELECT control_number, fetched, hit FROM records WHERE control_number IN ({','.join('?' * len(chunk))})", chunk)
+            for control_number, fetched, hit in rows:
+                found[control_number] = (json.loads(hit), date.fromisoformat(fetched))
+        return found
+
+    # Records of a profile in order, or None if the profile is not stored
+    def profile(self, BAI):
+        if self.updated(BAI) is None:
+            return None
+        rows = self.connection.execute(
+            'SELECT hit FROM authorship JOIN records USING (control_number) WHERE BAI = ? ORDER BY position', (BAI,))
+        return [json.loads(hit) for hit, in rows]
+
+    # All the stored records, one at a time
+    def hits(self):
+        for hit, in self.connection.execute('SELECT hit FROM records ORDER BY control_number'):
+            yield json.loads(hit)
+
+    # Date the profile was stored, or None
+    def updated(self, BAI):
+        row = self.connection.execute('SELECT updated FROM profiles WHERE BAI = ?', (BAI,)).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    # Store the up-to-date records of a profile and their order
+    def put_profile(self, BAI, data):
+        today = date.today().isoformat()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO records (control_number, fetched, hit) VALUES (?, ?, ?)',
+                ((hit['metadata']['control_number'], today, json.dumps(hit, ensure_ascii=False)) for hit in data))
+            self.connection.execute('DELETE FROM authorship WHERE BAI = ?', (BAI,))
+            self.connection.executemany('INSERT INTO authorship (BAI, position, control_number) VALUES (?, ?, ?)',
+                ((BAI, position, hit['metadata']['control_number']) for position, hit in enumerate(data)))
+            self.connection.execute('INSERT OR REPLACE INTO profiles (BAI, updated) VALUES (?, ?)', (BAI, today))
+            # Records no longer in any profile
+            self.connection.execute('DELETE FROM records WHERE control_number NOT IN (SELECT control_number FROM authorship)')
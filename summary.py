@@ -3,26 +3,17 @@ import numpy as np
 # Count the number of hits in each collection
 def count_document_type(data):
     doc_type_counts = {}
-    for hit in data:
-        doc_type = hit['metadata']['document_type']
-        for doc in doc_type:
-            if doc in doc_type_counts:
-                doc_type_counts[doc] += 1
-            else:
-                doc_type_counts[doc] = 1
+    for doc in data.document_types:
+        count = int(np.count_nonzero(data.has_document_type(doc)))
+        if count:
+            doc_type_counts[doc] = count
     return doc_type_counts
 
 
 # Count the number of hits per year
 def count_documents_per_year(data):
-    year_counts = {}
-    for hit in data:
-        hit_date = hit['metadata']['publication_or_earliest_date']
-        if hit_date in year_counts:
-            year_counts[hit_date] += 1
-        else:
-            year_counts[hit_date] = 1
-    return year_counts
+    years, counts = np.unique(data.year, return_counts=True)
+    return dict(zip(years.tolist(), counts.tolist()))
 
 
 # Print the total number of citations (for all, citeable and published hits)
@@ -50,8 +41,8 @@ def get_histogram(citations):
     return np.bincount(bin_indices, minlength=7)
 
 
-# Compute and print the breakdown of papers
-def breakdown_citations(cits_citeable, cits_noself_citeable, cits_published, cits_noself_published):
+# Compute the breakdown of papers by citations
+def compute_breakdown(cits_citeable, cits_noself_citeable, cits_published, cits_noself_published):
     total_hits_citeable = cits_citeable.size
     total_hits_published = cits_published.size
 
@@ -69,14 +60,27 @@ def breakdown_citations(cits_citeable, cits_noself_citeable, cits_published, cit
     if total_hits_published > 0:
         hists += [('published', hist_published), ('published-noself', hist_published_noself)]
 
-    breakdown = {j: {category: hist[i] for i, category in enumerate(categories)} for j, hist in hists}
+    return {j: {category: hist[i] for i, category in enumerate(categories)} for j, hist in hists}
+
+
+# Format the breakdown of papers
+def format_breakdown(breakdown):
+    if breakdown is None:
+        return None
+
+    published = 'published' in breakdown
 
     output = f'\n--Breakdown of papers by citations--'
     output += f'\n{"":<26} {"Citeable":^9}'
-    if total_hits_published != 0:
+    if published:
         output += f' {"Published":^9}'
     for category in categories:
         output += f'\n{category:<26} {breakdown["citeable"][category]:>4}|{breakdown["citeable-noself"][category]:<4}'
-        if total_hits_published != 0:
+        if published:
             output += f' {breakdown["published"][category]:>4}|{breakdown["published-noself"][category]:<4}'
     return output
+
+
+# Compute and print the breakdown of papers
+def breakdown_citations(cits_citeable, cits_noself_citeable, cits_published, cits_noself_published):
+    return format_breakdown(compute_breakdown(cits_citeable, cits_noself_citeable, cits_published, cits_noself_published))
@@ -0,0 +1,112 @@
+# Timing of the phases of a run: wall time, and optionally peak allocations and number of hits
+import json
+import os
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class PhaseTimer:
+    def __init__(self, trace_memory=False):
+        self.phases = []
+        self.pages = []
+        self.trace_memory = trace_memory
+        # Phases running, to nest them
+        self._running = []
+        if trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    # Time a phase; the yielded record can be given the number of hits
+    @contextmanager
+    def phase(self, name):
+        record = {'name': name, 'depth': len(self._running), 'seconds': None, 'peak_bytes': None, 'hits': None}
+        self.phases.append(record)
+        if self.trace_memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak of the outer phases is kept before resetting it
+            for outer in self._running:
+                outer['_peak'] = max(outer['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start'] = current
+            record['_peak'] = current
+        self._running.append(record)
+        start = perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = perf_counter() - start
+            self._running.pop()
+            if self.trace_memory:
+                peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = peak - record.pop('_start')
+                for outer in self._running:
+                    outer['_peak'] = max(outer['_peak'], peak)
+
+    # Latency, size and retries of a downloaded page
+    def add_page(self, page, seconds, size=None, retries=0):
+        self.pages.append({'page': page, 'seconds': seconds, 'bytes': size, 'retries': retries})
+
+    def to_dict(self):
+        return {'phases': self.phases, 'pages': self.pages}
+
+    # Print the phases as a table, and a summary of the downloaded pages
+    def report(self, file):
+        total = sum(record['seconds'] for record in self.phases if record['depth'] == 0)
+        print(f'{"Phase":<28} {"ms":>9} {"peak MB":>9} {"hits":>9}', file=file)
+        for record in self.phases:
+            name = '  ' * record['depth'] + record['name']
+            peak = f"{record['peak_bytes'] / 2**20:.2f}" if record['peak_bytes'] is not None else ''
+            hits = record['hits'] if record['hits'] is not None else ''
+            print(f"{name:<28} {record['seconds'] * 1e3:>9.2f} {peak:>9} {hits:>9}", file=file)
+        print(f'{"total":<28} {total * 1e3:>9.2f}', file=file)
+        if self.pages:
+            latencies = sorted(page['seconds'] for page in self.pages)
+            size = sum(page['bytes'] or 0 for page in self.pages)
+            retries = sum(page['retries'] for page in self.pages)
+            print(f'Pages: {len(self.pages)}, MB: {size / 2**20:.2f}, retries: {retries}, '
+                f'latency ms: median {latencies[len(latencies) // 2] * 1e3:.1f}, max {latencies[-1] * 1e3:.1f}', file=file)
+
+    # Print the table to stderr, or write the records as JSON if a file name is given
+    def write(self, destination='-'):
+        if destination == '-':
+            self.report(sys.stderr)
+        else:
+            with open(destination, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, indent=2)
+
+
+# Timer of the pipeline stages; None unless the instrumentation is enabled
+active = None
+
+
+# Enable the instrumentation with the given timer
+def enable(timer):
+    global active
+    active = timer
+
+
+# Destination of the timings from the environment: CITATIONS_TIMINGS=1 prints the table, any other value is a JSON file
+def destination_from_environment():
+    value = os.environ.get('CITATIONS_TIMINGS')
+    if not value or value == '0':
+        return None
+    return '-' if value == '1' else value
+
+
+# Time a stage of the pipeline, if the instrumentation is enabled
+@contextmanager
+def stage(name):
+    if active is None:
+        yield {}
+    else:
+        with active.phase(name) as record:
+            yield record
+
+
+# Record a downloaded page, if the instrumentation is enabled
+def record_page(page, seconds, size=None, retries=0):
+    if active is not None:
+        active.add_page(page, seconds, size, retries)
@@ -0,0 +1,116 @@
+# HTTP transports used to query the INSPIRE-HEP API
+import threading
+from time import monotonic, sleep
+
+# INSPIRE-HEP literature endpoint
+INSPIRE_API = 'https://inspirehep.net/api/literature'
+
+
+# Error raised by a transport when a request fails
+class TransportError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+# Token-bucket rate limiter shared by all the download threads
+class RateLimiter:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # A non-positive rate disables the limiter
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        # The token is reserved, wait outside the lock until it is actually available
+        if wait > 0:
+            sleep(wait)
+
+
+# Transport based on requests, with one pooled keep-alive session per thread
+class RequestsTransport:
+    def __init__(self, pool_size=4, timeout=60):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Number of bytes received, summed over all the threads
+        self.bytes_received = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
+
+    # Size of the last response received by the current thread
+    @property
+    def last_response_bytes(self):
+        return getattr(self._local, 'last_bytes', None)
+
+    # Return the decoded JSON response of a GET request
+    def get(self, url, params=None):
+        import requests
+        try:
+            response = self._session().get(url, params=params, timeout=self.timeout)
+            self._local.last_bytes = len(response.content)
+            with self._lock:
+                self.bytes_received += len(response.content)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            retry_after = e.response.headers.get('Retry-After') if e.response is not None else None
+            raise TransportError(str(e), status, retry_after) from e
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise TransportError(str(e)) from e
+
+
+# Transient errors, retried with exponential backoff; errors with no status are connection errors
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+# Seconds to wait before retrying: the Retry-After header, in seconds or as a date, or the backoff
+def retry_delay(retry_after, backoff, max_delay=300):
+    if retry_after:
+        try:
+            return min(max_delay, max(0, float(retry_after)))
+        except ValueError:
+            from datetime import datetime, timezone
+            from email.utils import parsedate_to_datetime
+            try:
+                return min(max_delay, max(0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()))
+            except (TypeError, ValueError):
+                pass
+    return min(max_delay, backoff)
+
+
+# GET with retries of the transient errors; return the response and the number of retries
+def get_with_retries(transport, url, params, limiter, max_retries=5, backoff=1):
+    retries = 0
+    while True:
+        limiter.acquire()
+        try:
+            return transport.get(url, params), retries
+        except TransportError as e:
+            if retries >= max_retries or (e.status is not None and e.status not in retry_statuses):
+                raise
+            sleep(retry_delay(e.retry_after, backoff * 2**retries))
+            retries += 1